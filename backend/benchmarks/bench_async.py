@@ -0,0 +1,89 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from flaskr import create_app
+from models import db
+from .common import temp_database_path, seed
+from .suite import run_http
+
+'''
+The read-only routes served by the WSGI app (flask run, a single
+worker without threads) and by the async app (hypercorn, a single
+worker), each driven over HTTP at several concurrencies.
+Run from the backend directory:
+    python -m benchmarks.bench_async --size 10000 --concurrency 1 8 32
+'''
+
+SERVERS = {
+    'wsgi': lambda port: [sys.executable, '-m', 'flask',
+                          '--app', 'flaskr:create_app()', 'run',
+                          '--port', str(port), '--without-threads'],
+    'asgi': lambda port: [sys.executable, '-m', 'hypercorn',
+                          '--bind', '127.0.0.1:{}'.format(port),
+                          'flaskr.asgi:create_async_app()'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server on port {} did not start'.format(port))
+
+
+def run(size, requests_num, concurrencies):
+    database_path, file_path = temp_database_path()
+    try:
+        app = create_app(database_path)
+        seed(app, size)
+        with app.app_context():
+            db.session.remove()
+            db.get_engine(app).dispose()
+
+        env = dict(os.environ, DATABASE_URL=database_path)
+        print('%6s %12s %-40s %9s %9s %9s' % (
+            'server', 'concurrency', 'endpoint', 'p50_ms', 'p95_ms', 'rps'))
+        for name, command in SERVERS.items():
+            port = free_port()
+            server = subprocess.Popen(command(port), env=env,
+                                      stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL)
+            try:
+                wait_for(port)
+                for concurrency in concurrencies:
+                    results = run_http('http://127.0.0.1:{}'.format(port),
+                                       requests_num, concurrency)
+                    for endpoint, stats in results.items():
+                        print('%6s %12d %-40s %9.3f %9.3f %9.0f' % (
+                            name, concurrency, endpoint, stats['p50_ms'],
+                            stats['p95_ms'], stats['rps']))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        os.remove(file_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Requests per endpoint and concurrency.')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 8, 32])
+    args = parser.parse_args()
+    run(args.size, args.requests, args.concurrency)
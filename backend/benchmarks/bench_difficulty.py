@@ -0,0 +1,71 @@
+import argparse
+import math
+import random
+import sys
+import time
+
+from flaskr.quiz import QuestionPicker, difficulty_weights
+
+'''
+Weighted quiz picks: the cost of a draw as the question bank grows,
+and the distribution of millions of draws against the weights.
+Runs on an in-memory QuestionPicker, no database is needed.
+Run from the backend directory:
+    python -m benchmarks.bench_difficulty --sizes 10000 1000000 \\
+        --draws 1000000
+Exits with status 1 when a difficulty's share is more than
+--sigmas standard deviations away from its weight.
+'''
+
+DIFFICULTIES = [1, 2, 3, 4, 5]
+
+
+def synthetic_rows(size, rng):
+    return [(question_id, rng.randint(1, 6), rng.choice(DIFFICULTIES))
+            for question_id in range(1, size + 1)]
+
+
+def run(sizes, draws, target, sigmas):
+    weights = difficulty_weights(DIFFICULTIES, target)
+    total = sum(weights.values())
+    print('%10s %10s %10s %12s' % ('questions', 'draws', 'ns/draw',
+                                   'max_sigma'))
+    ok = True
+    for size in sizes:
+        rng = random.Random(0)
+        picker = QuestionPicker(rng=rng)
+        picker.fill(synthetic_rows(size, rng))
+        difficulty_of = {row_id: difficulty for row_id, _, difficulty
+                         in synthetic_rows(size, random.Random(0))}
+        counts = dict.fromkeys(DIFFICULTIES, 0)
+
+        started = time.perf_counter()
+        for _ in range(draws):
+            counts[difficulty_of[picker.pick(None, (), weights)]] += 1
+        elapsed = time.perf_counter() - started
+
+        worst = 0.0
+        for difficulty, count in counts.items():
+            expected = weights[difficulty] / total
+            deviation = math.sqrt(draws * expected * (1 - expected))
+            worst = max(worst, abs(count - draws * expected) / deviation)
+        ok = ok and worst <= sigmas
+        print('%10d %10d %10.0f %12.2f' % (size, draws,
+                                           elapsed / draws * 1e9, worst))
+        for difficulty in DIFFICULTIES:
+            print('%21s %d: %.4f observed, %.4f expected' % (
+                'difficulty', difficulty, counts[difficulty] / draws,
+                weights[difficulty] / total))
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    parser.add_argument('--draws', type=int, default=1000000)
+    parser.add_argument('--target', type=int, default=4)
+    parser.add_argument('--sigmas', type=float, default=5.0)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.sizes, args.draws, args.target, args.sigmas)
+             else 1)
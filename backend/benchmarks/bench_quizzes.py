@@ -0,0 +1,51 @@
+import argparse
+import os
+
+from flaskr import create_app
+from models import db
+from .common import temp_database_path, seed, measure
+
+'''
+POST /quizzes latency as the question bank and the
+previous_questions list grow.
+Run from the backend directory:
+    python -m benchmarks.bench_quizzes --sizes 1000 10000 100000
+The p50 column should stay flat down each size block.
+'''
+
+
+def run(sizes, previous_sizes, repeat):
+    print('%10s %10s %10s %10s' % ('questions', 'previous', 'p50_ms',
+                                   'p95_ms'))
+    for size in sizes:
+        database_path, file_path = temp_database_path()
+        try:
+            app = create_app(database_path)
+            seed(app, size)
+            client = app.test_client()
+            for previous_num in previous_sizes:
+                body = {
+                    'previous_questions': list(range(1, previous_num + 1)),
+                    'quiz_category': {'type': 'Science', 'id': 1},
+                }
+                client.post('/quizzes', json=body)  # warm the index
+                stats = measure(lambda: client.post('/quizzes', json=body),
+                                repeat)
+                print('%10d %10d %10.3f %10.3f' % (
+                    size, previous_num, stats['p50_ms'], stats['p95_ms']))
+            with app.app_context():
+                db.session.remove()
+                db.get_engine(app).dispose()
+        finally:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--previous', type=int, nargs='+',
+                        default=[0, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.previous, args.repeat)
@@ -0,0 +1,63 @@
+import argparse
+import os
+
+from flaskr import create_app
+from flaskr.search import TrigramIndex
+from models import db, Question
+from .common import temp_database_path, seed, measure
+
+'''
+POST /questions/search: the ILIKE scan that used to serve every
+search against the in-process trigram index used on SQLite.
+Run from the backend directory:
+    python -m benchmarks.bench_search --sizes 1000 10000 100000
+'''
+
+TERMS = ['number 4', 'question number 12345', 'answer', 'zzz']
+
+
+def ilike_search(term):
+    selection = Question.query \
+        .filter(Question.question.ilike('%' + term + '%')) \
+        .order_by(Question.question) \
+        .all()
+    return [question.format() for question in selection][:10]
+
+
+def index_search(index, term):
+    ids = index.search(term)
+    page_ids = ids[:10]
+    return [question.format() for question in
+            Question.query.filter(Question.id.in_(page_ids)).all()]
+
+
+def run(sizes, repeat):
+    print('%10s %24s %12s %12s' % ('questions', 'term', 'ilike_ms',
+                                   'index_ms'))
+    for size in sizes:
+        database_path, file_path = temp_database_path()
+        try:
+            app = create_app(database_path)
+            seed(app, size)
+            with app.app_context():
+                index = TrigramIndex()
+                index.search('warm up')
+                for term in TERMS:
+                    ilike = measure(lambda: ilike_search(term), repeat)
+                    indexed = measure(lambda: index_search(index, term),
+                                      repeat)
+                    print('%10d %24s %12.3f %12.3f' % (
+                        size, term, ilike['p50_ms'], indexed['p50_ms']))
+                db.session.remove()
+                db.get_engine(app).dispose()
+        finally:
+            os.remove(file_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
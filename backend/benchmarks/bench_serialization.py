@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+
+from flaskr import create_app, serialization
+from flaskr.serialization import QUESTION_COLUMNS, row_dicts
+from models import db, Question
+from .common import temp_database_path, seed, measure
+
+'''
+Serializing a page of questions: ORM instances through
+Question.format() and the standard library (the former path),
+against column tuples encoded by the standard library and by
+orjson (when installed).
+Run from the backend directory:
+    python -m benchmarks.bench_serialization --rows 10 1000 100000
+'''
+
+
+def orm_path(rows_num):
+    questions = Question.query.order_by(Question.id).limit(rows_num).all()
+    return json.dumps({'questions': [question.format()
+                                     for question in questions]})
+
+
+def columns_path(rows_num):
+    rows = db.session.query(*QUESTION_COLUMNS).order_by(Question.id)\
+        .limit(rows_num).all()
+    return serialization.dumps({'questions': row_dicts(rows)})
+
+
+def run(rows_nums, repeat):
+    print('%10s %12s %14s %14s' % ('rows', 'orm_json_ms', 'columns_json_ms',
+                                   'columns_fast_ms'))
+    database_path, file_path = temp_database_path()
+    try:
+        app = create_app(database_path)
+        seed(app, max(rows_nums))
+        with app.app_context():
+            for rows_num in rows_nums:
+                times = max(1, repeat * 10 // rows_num) if rows_num > 10 \
+                    else repeat
+                orm = measure(lambda: orm_path(rows_num), times)
+                fast_encoder = serialization.orjson
+                serialization.orjson = None
+                try:
+                    stdlib = measure(lambda: columns_path(rows_num), times)
+                finally:
+                    serialization.orjson = fast_encoder
+                fast = None
+                if fast_encoder is not None:
+                    fast = measure(lambda: columns_path(rows_num), times)
+                print('%10d %12.3f %14.3f %14s' % (
+                    rows_num, orm['p50_ms'], stdlib['p50_ms'],
+                    '%.3f' % fast['p50_ms'] if fast else 'n/a'))
+            db.session.remove()
+            db.get_engine(app).dispose()
+    finally:
+        os.remove(file_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+',
+                        default=[10, 1000, 100000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    run(args.rows, args.repeat)
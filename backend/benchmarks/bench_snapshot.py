@@ -0,0 +1,64 @@
+import argparse
+import os
+import tracemalloc
+
+from flaskr import create_app
+from models import db
+from .common import temp_database_path, seed, measure
+
+'''
+Read-only snapshot mode: memory held by the snapshot and latency of
+the read endpoints served from it, against the same app reading
+through the ORM. Seeds a throw-away SQLite database per bank size.
+Run from the backend directory:
+    python -m benchmarks.bench_snapshot --sizes 10000 100000
+'''
+
+QUIZ_BODY = {
+    'previous_questions': list(range(1, 50)),
+    'quiz_category': {'type': 'Science', 'id': 1},
+}
+
+ENDPOINTS = [
+    ('GET /questions', lambda client: client.get('/questions?page=3')),
+    ('GET /categories/2/questions',
+     lambda client: client.get('/categories/2/questions?page=2')),
+    ('POST /quizzes', lambda client: client.post('/quizzes',
+                                                 json=QUIZ_BODY)),
+]
+
+
+def run(sizes, requests_num):
+    print('%10s %-9s %10s %-28s %9s %9s' % (
+        'questions', 'mode', 'mem_mb', 'endpoint', 'p50_ms', 'p95_ms'))
+    for size in sizes:
+        database_path, path = temp_database_path()
+        try:
+            seed(create_app(database_path), size)
+            for mode, read_only in (('orm', False), ('snapshot', True)):
+                tracemalloc.start()
+                app = create_app(database_path, read_only=read_only)
+                memory = tracemalloc.get_traced_memory()[0]
+                tracemalloc.stop()
+
+                client = app.test_client()
+                for endpoint, call in ENDPOINTS:
+                    call(client)  # warm up caches and indexes
+                    stats = measure(lambda: call(client), requests_num)
+                    print('%10d %-9s %10.1f %-28s %9.3f %9.3f' % (
+                        size, mode, memory / 2 ** 20, endpoint,
+                        stats['p50_ms'], stats['p95_ms']))
+                with app.app_context():
+                    db.session.remove()
+                    db.get_engine().dispose()
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+    run(args.sizes, args.requests)
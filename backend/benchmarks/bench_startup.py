@@ -0,0 +1,56 @@
+import argparse
+import os
+import statistics
+
+import models
+from flaskr import create_app
+from .common import temp_database_path, seed
+
+'''
+Cost of create_app(), phase by phase (see flaskr.startup), when
+each app opens its own engine and when the apps of the process
+share one, as workers and the test suite (an app per test) do.
+Run from the backend directory:
+    python -m benchmarks.bench_startup --apps 50
+'''
+
+
+def profile_apps(database_path, apps, shared):
+    phases = {}
+    for _ in range(apps):
+        if not shared:
+            for engine in models._engines.values():
+                engine.dispose()
+            models._engines.clear()
+        app = create_app(database_path)
+        for phase, ms in app.extensions['startup_profile'].as_dict().items():
+            phases.setdefault(phase, []).append(ms)
+    return phases
+
+
+def run(size, apps):
+    database_path, path = temp_database_path()
+    try:
+        seed(create_app(database_path), size)
+        print('%-16s %12s %12s' % ('phase', 'private_ms', 'shared_ms'))
+        private = profile_apps(database_path, apps, shared=False)
+        shared = profile_apps(database_path, apps, shared=True)
+        for phase in private:
+            print('%-16s %12.3f %12.3f' % (
+                phase, statistics.median(private[phase]),
+                statistics.median(shared[phase])))
+        print('%-16s %12.3f %12.3f' % (
+            'total', sum(map(statistics.median, private.values())),
+            sum(map(statistics.median, shared.values()))))
+    finally:
+        for engine in models._engines.values():
+            engine.dispose()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--apps', type=int, default=50)
+    args = parser.parse_args()
+    run(args.size, args.apps)
@@ -0,0 +1,67 @@
+import argparse
+import random
+import time
+import tracemalloc
+
+from flaskr.suggest import PrefixIndex
+
+'''
+Search-as-you-type: build time, memory and the cost of a
+suggestion as the question bank grows, plus the cost of keeping
+the index up to date. Runs on an in-memory PrefixIndex, no
+database is needed.
+Run from the backend directory:
+    python -m benchmarks.bench_suggest --sizes 10000 100000
+'''
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'ze', 'po']
+
+
+def synthetic_questions(size, rng):
+    def word():
+        return ''.join(rng.choice(SYLLABLES)
+                       for _ in range(rng.randint(1, 4)))
+    return [(question_id, ' '.join(word() for _ in range(8)) + '?',
+             rng.randint(1, 6))
+            for question_id in range(1, size + 1)]
+
+
+def run(sizes, queries):
+    print('%10s %10s %10s %12s %12s' % ('questions', 'build_s', 'mem_mb',
+                                        'us/suggest', 'us/update'))
+    for size in sizes:
+        rng = random.Random(0)
+        rows = synthetic_questions(size, rng)
+        index = PrefixIndex(loader=None)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        index.fill(rows)
+        build = time.perf_counter() - started
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        prefixes = [rng.choice(rows)[1][:rng.randint(1, 6)]
+                    for _ in range(queries)]
+        started = time.perf_counter()
+        for prefix in prefixes:
+            index.suggest(prefix)
+        suggest = (time.perf_counter() - started) / queries
+
+        started = time.perf_counter()
+        for question_id, question, category in rows[:1000]:
+            index._remove(question_id)
+            index._add(question_id, question, category)
+        update = (time.perf_counter() - started) / 1000
+
+        print('%10d %10.2f %10.1f %12.1f %12.1f' % (
+            size, build, memory / 2 ** 20, suggest * 1e6, update * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000])
+    parser.add_argument('--queries', type=int, default=10000)
+    args = parser.parse_args()
+    run(args.sizes, args.queries)
@@ -0,0 +1,75 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from models import db, init_db, Question, Category
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History',
+              'Entertainment', 'Sports']
+SEED_CHUNK = 10000
+
+'''
+Helpers shared by the benchmark scripts.
+Benchmarks run against a throw-away SQLite file seeded with a
+synthetic question bank, so they need neither Postgres nor the
+trivia.psql fixture.
+'''
+
+
+def temp_database_path():
+    fd, path = tempfile.mkstemp(prefix='trivia-bench-', suffix='.db')
+    os.close(fd)
+    return 'sqlite:///' + path, path
+
+
+def seed(app, questions_num, rng=None):
+    rng = rng or random.Random(0)
+    with app.app_context():
+        init_db()
+        db.session.execute(Category.__table__.insert(),
+                           [{'id': i + 1, 'type': category_type}
+                            for i, category_type in enumerate(CATEGORIES)])
+        for start in range(0, questions_num, SEED_CHUNK):
+            rows = [{
+                'question': 'Synthetic question number %d?' % i,
+                'answer': 'Answer %d' % i,
+                'category': rng.randint(1, len(CATEGORIES)),
+                'difficulty': rng.randint(1, 5),
+            } for i in range(start, min(start + SEED_CHUNK, questions_num))]
+            db.session.execute(Question.__table__.insert(), rows)
+        db.session.commit()
+
+
+def percentile(timings, fraction):
+    index = max(0, int(round(len(timings) * fraction)) - 1)
+    return timings[min(index, len(timings) - 1)]
+
+
+'''
+summarize(timings, wall_seconds)
+    latency percentiles in milliseconds and throughput of a run.
+'''
+
+
+def summarize(timings, wall_seconds):
+    timings = sorted(timings)
+    return {
+        'requests': len(timings),
+        'p50_ms': statistics.median(timings) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': statistics.mean(timings) * 1000,
+        'rps': len(timings) / wall_seconds if wall_seconds else 0.0,
+    }
+
+
+def measure(func, repeat):
+    timings = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings, time.perf_counter() - started)
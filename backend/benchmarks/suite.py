@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flaskr import create_app
+from models import db
+from .common import temp_database_path, seed, measure, summarize
+
+'''
+Benchmark suite of every route of create_app.
+Seeds a synthetic question bank at each size, drives every route
+through the Flask test client and reports p50/p95/p99 latency,
+requests per second and the peak memory of each endpoint: the
+most Python heap its first request had allocated at once
+(tracemalloc), including the caches and indexes it warms up.
+Run from the backend directory:
+    python -m benchmarks.suite --sizes 1000 100000 --output run.json
+    python -m benchmarks.suite --compare run.json --output new.json
+With --url, the read-only routes are instead driven over HTTP by
+--concurrency threads against an already running server.
+'''
+
+BULK_ROWS = 100
+BULK_DELETE_IDS = 10
+
+
+def _bulk_body():
+    return '\n'.join(json.dumps({
+        'question': 'Benchmark bulk question {}?'.format(i),
+        'answer': 'Answer',
+        'difficulty': 1 + i % 5,
+        'category': 1 + i % 6,
+    }) for i in range(BULK_ROWS))
+
+
+def _session(state):
+    return '/quizzes/sessions/{}/next'.format(state.get('session_id'))
+
+
+def _created(state):
+    ids = state.setdefault('created', [])
+    return '/questions/{}'.format(ids.pop() if ids else 0)
+
+
+def _created_batch(state):
+    ids = state.setdefault('created', [])
+    batch, ids[:] = ids[-BULK_DELETE_IDS:], ids[:-BULK_DELETE_IDS]
+    return {'json': {'ids': batch or [0]}}
+
+
+QUIZ_BODY = {
+    'previous_questions': list(range(1, 50)),
+    'quiz_category': {'type': 'Science', 'id': 1},
+}
+
+'''
+Scenarios
+    (rule, method, build, repeat factor, read-only).
+    build(state) returns the path and the request keyword arguments,
+    state is shared by the scenarios of a run (created ids, session).
+    Writes come after the reads, and POST /questions before the
+    DELETE that consumes the ids it created.
+'''
+
+SCENARIOS = [
+    ('/categories', 'GET', lambda state: ('/categories', {}), 1, True),
+    ('/questions', 'GET', lambda state: ('/questions?page=3', {}), 1, True),
+    ('/categories/<int:category_id>/questions', 'GET',
+     lambda state: ('/categories/2/questions?page=2', {}), 1, True),
+    ('/categories/<int:category_id>/questions?format=ndjson', 'GET',
+     lambda state: ('/categories/2/questions?format=ndjson', {}),
+     0.05, True),
+    ('/questions/suggest', 'GET',
+     lambda state: ('/questions/suggest?prefix=number%2012', {}), 1, True),
+    ('/questions/search', 'POST',
+     lambda state: ('/questions/search',
+                    {'json': {'searchTerm': 'number 12'}}), 1, True),
+    ('/quizzes', 'POST',
+     lambda state: ('/quizzes', {'json': QUIZ_BODY}), 1, True),
+    ('/quizzes/batch', 'POST',
+     lambda state: ('/quizzes/batch', {'json': dict(
+         QUIZ_BODY, questions_num=5)}), 1, True),
+    ('/quizzes/sessions', 'POST',
+     lambda state: ('/quizzes/sessions', {'json': {
+         'questions_num': 1000, 'quiz_category': {'type': 'all'}}}),
+     1, False),
+    ('/quizzes/sessions/<session_id>/next', 'GET',
+     lambda state: (_session(state), {}), 1, False),
+    ('/questions/export', 'GET',
+     lambda state: ('/questions/export', {}), 0.05, True),
+    ('/stats', 'GET', lambda state: ('/stats', {}), 1, True),
+    ('/metrics', 'GET', lambda state: ('/metrics', {}), 1, True),
+    ('/questions', 'POST',
+     lambda state: ('/questions', {'json': {
+         'question': 'Benchmark question?', 'answer': 'Answer',
+         'difficulty': 2, 'category': 3}}), 1, False),
+    ('/questions/<int:question_id>', 'DELETE',
+     lambda state: (_created(state), {}), 1, False),
+    ('/questions', 'DELETE',
+     lambda state: ('/questions', _created_batch(state)), 0.1, False),
+    ('/snapshot/reload', 'POST',
+     lambda state: ('/snapshot/reload', {}), 0.05, False),
+    ('/questions/bulk', 'POST',
+     lambda state: ('/questions/bulk', {
+         'data': _bulk_body(), 'content_type': 'application/x-ndjson'}),
+     0.1, False),
+]
+
+
+def peak_alloc_kb(call):
+    # traced apart from the timed requests, tracing slows them down
+    tracemalloc.start()
+    try:
+        call()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def uncovered_routes(app):
+    covered = {(rule, method) for rule, method, _, _, _ in SCENARIOS}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in rule.methods - {'HEAD', 'OPTIONS'}:
+            if (rule.rule, method) not in covered:
+                missing.append('{} {}'.format(method, rule.rule))
+    return sorted(missing)
+
+
+def _remember(state, response):
+    response.get_data()  # consumes streamed bodies
+    data = response.get_json(silent=True) or {}
+    if 'created' in data:
+        state.setdefault('created', []).append(data['created'])
+    if 'session_id' in data:
+        state['session_id'] = data['session_id']
+
+
+def run_client(app, requests_num):
+    client = app.test_client()
+    state = {}
+    results = {}
+    for rule, method, build, factor, _ in SCENARIOS:
+        repeat = max(1, int(requests_num * factor))
+        if method == 'DELETE':
+            # ids to delete, one per request or a batch for bulk deletes
+            per_request = BULK_DELETE_IDS if rule == '/questions' else 1
+            for _ in range(repeat * per_request -
+                           len(state.get('created', []))):
+                _remember(state, client.post('/questions', json={
+                    'question': 'To delete?', 'answer': 'Yes',
+                    'difficulty': 1, 'category': 1}))
+
+        def call():
+            path, kwargs = build(state)
+            _remember(state, client.open(path, method=method, **kwargs))
+
+        # the first call warms up caches and indexes
+        peak_kb = peak_alloc_kb(call)
+        stats = measure(call, repeat)
+        stats['peak_alloc_kb'] = peak_kb
+        results['{} {}'.format(method, rule)] = stats
+    return results
+
+
+def run_http(base_url, requests_num, concurrency):
+    results = {}
+    for rule, method, build, factor, read_only in SCENARIOS:
+        if not read_only:
+            continue
+        path, kwargs = build({})
+        data = None
+        headers = {}
+        if 'json' in kwargs:
+            data = json.dumps(kwargs['json']).encode()
+            headers['Content-Type'] = 'application/json'
+
+        def call(_):
+            req = urllib.request.Request(base_url + path, data=data,
+                                         headers=headers, method=method)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req) as response:
+                    response.read()
+            except urllib.error.HTTPError as error:
+                error.read()  # 404s and 422s are timed like the rest
+            return time.perf_counter() - start
+
+        repeat = max(1, int(requests_num * factor))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = list(pool.map(call, range(repeat)))
+        results['{} {}'.format(method, rule)] = summarize(
+            timings, time.perf_counter() - started)
+    return results
+
+
+'''
+compare(previous, current, threshold)
+    endpoints whose p95 latency grew, or whose throughput dropped,
+    by more than `threshold` (a fraction) since the previous run.
+'''
+
+
+def compare(previous, current, threshold):
+    regressions = []
+    for size, endpoints in current['results'].items():
+        for endpoint, stats in endpoints.items():
+            before = previous['results'].get(size, {}).get(endpoint)
+            if before is None:
+                continue
+            if stats['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                regressions.append('{} @ {}: p95 {:.2f} -> {:.2f} ms'.format(
+                    endpoint, size, before['p95_ms'], stats['p95_ms']))
+            if stats['rps'] < before['rps'] * (1 - threshold):
+                regressions.append('{} @ {}: {:.0f} -> {:.0f} req/s'.format(
+                    endpoint, size, before['rps'], stats['rps']))
+    return regressions
+
+
+def print_results(results):
+    print('%8s %-48s %9s %9s %9s %9s %10s' % (
+        'size', 'endpoint', 'p50_ms', 'p95_ms', 'p99_ms', 'rps',
+        'peak_alloc_kb'))
+    for size, endpoints in results.items():
+        for endpoint, stats in endpoints.items():
+            print('%8s %-48s %9.3f %9.3f %9.3f %9.0f %10s' % (
+                size, endpoint, stats['p50_ms'], stats['p95_ms'],
+                stats['p99_ms'], stats['rps'], stats.get('peak_alloc_kb', '')))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000])
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Requests per endpoint.')
+    parser.add_argument('--url', help='Drive a running server over HTTP.')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--output', help='Write the results to this file.')
+    parser.add_argument('--compare', help='Flag regressions against a '
+                                          'previous results file.')
+    parser.add_argument('--threshold', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = {
+        'created': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'mode': 'http' if args.url else 'client',
+        'results': {},
+    }
+    if args.url:
+        report['results']['server'] = run_http(
+            args.url.rstrip('/'), args.requests, args.concurrency)
+    else:
+        for size in args.sizes:
+            database_path, file_path = temp_database_path()
+            try:
+                app = create_app(database_path)
+                missing = uncovered_routes(app)
+                if missing:
+                    print('routes without a scenario: ' + ', '.join(missing))
+                seed(app, size)
+                report['results'][str(size)] = run_client(app, args.requests)
+                with app.app_context():
+                    db.session.remove()
+                    db.get_engine(app).dispose()
+            finally:
+                os.remove(file_path)
+
+    print_results(report['results'])
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(json.load(previous), report, args.threshold)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,34 +1,323 @@
 # import os
-from flask import Flask, request, abort, jsonify
+import math
+
+import click
+from sqlalchemy.exc import SQLAlchemyError
+from flask import (Flask, Response, g, request, abort, jsonify,
+                   stream_with_context)
 # from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
-
-from models import setup_db, Question, Category
-
-QUESTIONS_PER_PAGE = 10
-
 
-def create_app():
+from models import (DB_PATH, setup_db, init_db, add_question_listener, db,
+                    has_trigram_support, notify_question_changed,
+                    rebuild_question_stats,
+                    table_versions, use_replicas, Question)
+from migrations import BACKFILL_BATCH_SIZE, run_migrations
+from .pagination import (QUESTIONS_PER_PAGE, CountCache,  # noqa: F401
+                         paginate_query, paginate_ids, count_query,
+                         decode_cursor, next_cursor)
+from .quiz import (QuestionPicker, load_question_categories, quiz_batch_size,
+                   quiz_session_size, quiz_weights)
+from .sessions import MemorySessionStore
+from .cache import CategoryCache
+from .search import (TrigramIndex, load_question_texts, search_filter,
+                     search_rank)
+from .suggest import (MAX_SUGGESTIONS, SUGGESTIONS, PrefixIndex,
+                      load_question_titles)
+from .metrics import Instrumentation
+from .http_cache import ResponseCache
+from .bulk import (parse_question, parse_bulk_delete, read_rows,
+                   import_questions, export_questions)
+from . import quiz, serialization
+from .serialization import FastJSONProvider
+from .stats import QuestionStats, stats_summary
+from .coherency import (CACHE_VERSIONS_PATH, CacheCoherency,
+                        SharedMemoryVersionStore)
+from .snapshot import READ_ONLY, QuestionSnapshot
+from .ratelimit import ConcurrencyLimit, RateLimiter, retry_after_headers
+from .startup import STARTUP_PROFILE, StartupProfile
+
+
+# POST routes that only read the database
+READ_ONLY_ENDPOINTS = {'search_questions', 'quizzes', 'quizzes_batch',
+                       'create_quiz_session'}
+
+
+def create_app(database_path=DB_PATH, session_store=None, version_store=None,
+               replica_paths=None, read_only=READ_ONLY, rate_limit_store=None):
+    # time spent in each phase, see STARTUP_PROFILE
+    startup_profile = StartupProfile()
     app = Flask(__name__)
-    setup_db(app)
-    CORS(app)
-
-    def paginate_question(request, selection):
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-
-        questions = [question.format() for question in selection]
-        current_questions = questions[start:end]
-
-        return current_questions
+    app.json = FastJSONProvider(app)
+    app.extensions['startup_profile'] = startup_profile
+    startup_profile.mark('flask')
+    setup_db(app, database_path, replica_paths)
+    startup_profile.mark('setup_db')
 
     '''
     Set up CORS. Allow '*' for origins.
-    Delete the sample route after completing the TODOs
     '''
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    CORS(app)
+    instrumentation = Instrumentation(app)
+    startup_profile.mark('middleware')
+
+    # in read-only mode the questions are served from a snapshot
+    # taken at startup (and by POST /snapshot/reload)
+    snapshot = QuestionSnapshot() if read_only else None
+    if snapshot is not None:
+        fetch_question, fetch_questions = snapshot.question, snapshot.questions
+    else:
+        fetch_question = serialization.fetch_question
+        fetch_questions = serialization.fetch_questions
+
+    # counts of searches, the totals come from question_stats
+    count_cache = add_question_listener(CountCache(), app)
+    question_stats = QuestionStats()
+    app.extensions['question_stats'] = question_stats
+
+    category_cache = CategoryCache() if snapshot is None \
+        else CategoryCache(ttl=None)
+    with app.app_context():
+        try:
+            category_cache.all()
+        except SQLAlchemyError:
+            # no schema yet (e.g. `flask init-db`), loaded on first use
+            db.session.rollback()
+        # without pg_trgm, searches are served by an in-process index
+        try:
+            with db.engine.connect() as connection:
+                trigram_search = has_trigram_support(connection)
+        except SQLAlchemyError:
+            trigram_search = False
+    app.extensions['category_cache'] = category_cache
+    startup_profile.mark('category_cache')
+    instrumentation.add_metric(
+        'trivia_category_cache_hits_total', 'counter',
+        'Category lookups served from memory.',
+        lambda: category_cache.hits)
+    instrumentation.add_metric(
+        'trivia_category_cache_misses_total', 'counter',
+        'Category cache reloads from the database.',
+        lambda: category_cache.misses)
+
+    if version_store is None and CACHE_VERSIONS_PATH:
+        version_store = SharedMemoryVersionStore(CACHE_VERSIONS_PATH)
+    # ETags are only right when every worker sees every write
+    response_cache = ResponseCache(shared_versions=version_store is not None)
+    instrumentation.add_metric(
+        'trivia_response_cache_hits_total', 'counter',
+        'Responses served from the in-memory body cache.',
+        lambda: response_cache.hits)
+    instrumentation.add_metric(
+        'trivia_response_not_modified_total', 'counter',
+        'Conditional GETs answered with 304.',
+        lambda: response_cache.not_modified)
+
+    # search-as-you-type suggestions, built by create_app
+    prefix_index = add_question_listener(PrefixIndex(
+        loader=snapshot.title_rows if snapshot else load_question_titles), app)
+
+    search_index = None
+    if not trigram_search or snapshot is not None:
+        search_index = add_question_listener(TrigramIndex(
+            loader=snapshot.text_rows if snapshot else load_question_texts),
+            app)
+
+    def paginate_question(request, query, order_by=(Question.id,),
+                          keyset=True):
+        return paginate_query(request, query, order_by,
+                              keyset_column=Question.id if keyset else None)
+
+    def count_questions(key, query):
+        return count_query(count_cache, key, query)
+
+    def total_questions(category_id=None):
+        if snapshot is not None:
+            return snapshot.count(category_id)
+        return question_stats.total(category_id)
+
+    def list_questions(category_id=None):
+        try:
+            if snapshot is not None:
+                return snapshot.paginate(request.args, category_id)
+            query = Question.query
+            if category_id is not None:
+                query = query.filter_by(category=category_id)
+            return paginate_question(request, query)
+        except ValueError:
+            # malformed cursor
+            abort(400)
+
+    def write_response(response):
+        # the total comes from question_stats, the page is only
+        # fetched when asked for with ?include_page=1
+        response['total_questions'] = total_questions()
+        if request.args.get('include_page', 0, type=int):
+            response['questions'] = list_questions()
+        return response
+
+    question_picker = add_question_listener(QuestionPicker(
+        loader=snapshot.picker_rows if snapshot else load_question_categories),
+        app)
+
+    def load_snapshot():
+        total = snapshot.load()
+        category_cache.fill(snapshot.categories())
+        question_picker.invalidate()
+        prefix_index.invalidate()
+        search_index.invalidate()
+        count_cache.clear()
+        table_versions.bump('questions')
+        return total
+
+    startup_profile.mark('indexes')
+    if snapshot is not None:
+        with app.app_context():
+            load_snapshot()
+        startup_profile.mark('snapshot')
+
+    def build_prefix_index():
+        try:
+            prefix_index.load()
+        except SQLAlchemyError:
+            # no schema yet, loaded again by the next request
+            db.session.rollback()
+
+    with app.app_context():
+        build_prefix_index()
+    startup_profile.mark('prefix_index')
+
+    # with several workers, writes made by the others are seen
+    # through the shared version counters
+    coherency = None
+    if version_store is not None:
+        coherency = add_question_listener(CacheCoherency(version_store), app)
+        app.extensions['cache_coherency'] = coherency
+
+    def question_slice_keys():
+        return ['questions', 'questions:*', 'questions:None'] + \
+            ['questions:{}'.format(category['id'])
+             for category in category_cache.all()]
+
+    def question_slice_changed(key):
+        if key == 'questions':
+            table_versions.bump('questions')
+            count_cache.clear()
+        elif key == 'questions:*':
+            question_picker.invalidate()
+            prefix_index.invalidate()
+            if search_index is not None:
+                search_index.invalidate()
+        else:
+            category = key.split(':', 1)[1]
+            category_id = None if category == 'None' else int(category)
+            question_picker.invalidate_category(category_id)
+            prefix_index.invalidate_category(category_id)
+            if search_index is not None:
+                search_index.invalidate_category(category_id)
+
+    if coherency is not None:
+        coherency.watch(question_slice_keys, question_slice_changed)
+
+    def snapshot_keys():
+        return ['snapshot']
+
+    def snapshot_reloaded(key):
+        load_snapshot()
+
+    # a reload requested from one worker reloads the others
+    if coherency is not None and snapshot is not None:
+        coherency.watch(snapshot_keys, snapshot_reloaded)
+
+    def pick_question(category_id, previous_questions, weights=None):
+        return quiz.pick_question(question_picker, fetch_question,
+                                  question_picker.invalidate, category_id,
+                                  previous_questions, weights)
+
+    def sample_questions(category_id, questions_num, previous_questions):
+        return quiz.sample_questions(question_picker, fetch_questions,
+                                     question_picker.invalidate, category_id,
+                                     questions_num, previous_questions)
+
+    if session_store is None:
+        session_store = MemorySessionStore()
+
+    # per-client budgets, and a cap on the requests served at once
+    # so bursts are shed before they queue for a database connection
+    rate_limiter = RateLimiter(rate_limit_store)
+    concurrency_limit = ConcurrencyLimit()
+    app.extensions['rate_limiter'] = rate_limiter
+    app.extensions['concurrency_limit'] = concurrency_limit
+    instrumentation.add_metric(
+        'trivia_rate_limited_total', 'counter',
+        'Requests rejected with 429 by the rate limiter.',
+        lambda: rate_limiter.limited)
+    instrumentation.add_metric(
+        'trivia_requests_shed_total', 'counter',
+        'Requests rejected with 503 by the concurrency cap.',
+        lambda: concurrency_limit.shed)
+    instrumentation.add_metric(
+        'trivia_requests_in_flight', 'gauge',
+        'Requests being served by this process.',
+        lambda: concurrency_limit.in_flight)
+
+    def quiz_category_id(quiz_category):
+        if quiz_category['type'] == "all":
+            return None
+        category_id = category_cache.id_for(quiz_category['type'])
+        if category_id is None:
+            abort(422)
+        return category_id
+
+    @app.before_request
+    def limit_rate():
+        if rate_limiter.enabled and request.endpoint is not None:
+            wait = rate_limiter.check(request.endpoint, request.remote_addr)
+            if wait:
+                abort(429, retry_after=math.ceil(wait))
+
+    @app.before_request
+    def admit_request():
+        if request.method == 'OPTIONS':
+            return
+        if not concurrency_limit.enter():
+            abort(503, retry_after=1)
+        g.admitted = True
+
+    @app.teardown_request
+    def release_request(error):
+        if g.pop('admitted', False):
+            concurrency_limit.leave()
+
+    @app.before_request
+    def reject_writes():
+        if snapshot is not None and \
+                request.method not in ('GET', 'HEAD', 'OPTIONS') and \
+                request.endpoint not in READ_ONLY_ENDPOINTS | {
+                    'reload_snapshot'}:
+            abort(405)
+
+    @app.before_request
+    def check_question_stats():
+        question_stats.check()
+
+    @app.before_request
+    def load_prefix_index():
+        # after a reload, or when there was no schema at startup
+        if not prefix_index.loaded:
+            build_prefix_index()
+
+    @app.before_request
+    def poll_cache_versions():
+        if coherency is not None:
+            coherency.poll()
+
+    # reads may go to the replicas, writes switch the request back
+    # to the primary (see models.RoutingSession)
+    @app.before_request
+    def route_reads():
+        use_replicas(request.method in ('GET', 'HEAD') or
+                     request.endpoint in READ_ONLY_ENDPOINTS)
 
     '''
     Use the after_request decorator to set Access-Control-Allow
@@ -47,12 +336,11 @@ def create_app():
     for all available categories.
     '''
     @app.route('/categories')
+    @response_cache.cached('categories')
     def get_categories():
-        categories = Category.query.order_by(Category.id).all()
-        formatted_categories = [category.format() for category in categories]
         return jsonify({
             'success': True,
-            'categories': formatted_categories,
+            'categories': category_cache.all(),
         })
 
     '''
@@ -63,12 +351,9 @@ def create_app():
     number of total questions, current category, categories.
     '''
     @app.route('/questions')
+    @response_cache.cached('questions', 'categories')
     def get_questions():
-        selection = Question.query.order_by(Question.id).all()
-        current_questions = paginate_question(request, selection)
-
-        categories = Category.query.all()
-        formatted_categories = [category.format() for category in categories]
+        current_questions = list_questions()
 
         if len(current_questions) == 0:
             abort(404)
@@ -76,9 +361,9 @@ def create_app():
         return jsonify({
             'success': True,
             'questions': current_questions,
-            'categories': formatted_categories,
+            'categories': category_cache.all(),
             # 'current_category': 5,  # TODO: make it dynamic
-            'total_questions': len(selection),
+            'total_questions': total_questions(),
         })
 
     '''
@@ -93,15 +378,29 @@ def create_app():
                 abort(404)
 
             question.delete()
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_question(request, selection)
 
-            return jsonify({
+            return jsonify(write_response({
                 "success": True,
                 "deleted": question_id,
-                "questions": current_questions,
-                "total_questions": len(selection),
-            })
+            }))
+        except Exception:
+            abort(422)
+
+    '''
+    Delete many questions at once.
+    takes a list of question `ids` and/or a `category`, and deletes
+    the questions matching both with a single statement.
+    '''
+    @app.route('/questions', methods=['DELETE'])
+    def bulk_delete_questions():
+        try:
+            ids, category = parse_bulk_delete(request.get_json())
+            deleted = Question.bulk_delete(ids, category)
+
+            return jsonify(write_response({
+                'success': True,
+                'deleted': deleted,
+            }))
         except Exception:
             abort(422)
 
@@ -114,58 +413,91 @@ def create_app():
     def create_question():
         body = request.get_json()
         try:
-            new_question = body.get('question')
-            if not new_question:
-                abort(422)
-
-            new_answer = body.get('answer')
-            if not new_answer:
-                abort(422)
-
-            new_difficulty = int(body.get('difficulty'))
-            if new_difficulty < 1:
-                abort(422)
-
-            new_category = int(body.get('category'))
-            if not new_difficulty:
-                abort(422)
-            elif new_category not in range(1, 7):
-                abort(422)
-            question = Question(question=new_question,
-                                answer=new_answer,
-                                category=new_category,
-                                difficulty=new_difficulty
-                                )
+            question = Question(**parse_question(body, category_cache))
             question.insert()
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_question(request, selection)
 
-            return jsonify({
+            return jsonify(write_response({
                 'success': True,
                 'created': question.id,
-                'questions': current_questions,
-                'total_questions': len(selection),
-            })
+            }))
 
         except Exception:
             abort(422)
 
+    '''
+    Import many questions at once.
+    The body is NDJSON (one question object per line) or CSV with a
+    header row when sent as text/csv. Rows are inserted in chunked
+    transactions, invalid rows are skipped and reported.
+    '''
+    @app.route('/questions/bulk', methods=['POST'])
+    def bulk_create_questions():
+        rows = read_rows(request.stream, request.mimetype)
+        imported, errors = import_questions(rows, category_cache)
+
+        if imported == 0 and errors:
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'imported': imported,
+            'errors': errors,
+        })
+
+    '''
+    Export every question as NDJSON, streamed.
+    '''
+    @app.route('/questions/export')
+    def export_all_questions():
+        return Response(stream_with_context(export_questions()),
+                        mimetype='application/x-ndjson')
+
+    '''
+    Suggest questions as the user types.
+    takes a `prefix` and an optional `limit`, and returns the
+    questions having a word that starts with the last word of the
+    prefix (and containing its other words), from memory.
+    '''
+    @app.route('/questions/suggest')
+    @response_cache.cached('questions')
+    def suggest_questions():
+        prefix = request.args.get('prefix', '')
+        limit = request.args.get('limit', SUGGESTIONS, type=int)
+        if not prefix.strip() or not 1 <= limit <= MAX_SUGGESTIONS:
+            abort(400)
+
+        return jsonify({
+            'success': True,
+            'suggestions': prefix_index.suggest(prefix, limit),
+        })
+
     '''
     Get questions based on a search term.
     It should return any questions for whom the search term
-    is a substring of the question.
+    is a substring of the question (or of the answer, when
+    searchAnswers is set), most similar first.
     '''
     @app.route('/questions/search', methods=['POST'])
     def search_questions():
         body = request.get_json()
         question_param = body.get('searchTerm')
+        include_answers = bool(body.get('searchAnswers', False))
         try:
-            selection = Question.query \
-                .filter(Question.question.ilike('%' + question_param + '%')) \
-                .order_by(Question.question) \
-                .all()
-
-            current_questions = paginate_question(request, selection)
+            if search_index is not None:
+                ids = search_index.search(question_param, include_answers)
+                current_questions = fetch_questions(
+                    paginate_ids(request, ids))
+                questions_num = len(ids)
+            else:
+                selection = Question.query.filter(
+                    search_filter(question_param, include_answers))
+                current_questions = paginate_question(
+                    request, selection,
+                    order_by=(search_rank(question_param, include_answers),
+                              Question.id),
+                    keyset=False)
+                questions_num = count_questions(
+                    ('search', question_param, include_answers), selection)
 
             if len(current_questions) == 0:
                 abort(404)
@@ -173,28 +505,44 @@ def create_app():
             return jsonify({
                 "success": True,
                 "questions": current_questions,
-                "questions_num": len(selection),
+                "questions_num": questions_num,
             })
         except Exception:
             abort(404)
 
     '''
     Get questions based on category.
+    ordered by id, pages are located with `?page=` or the
+    `next_cursor` of the previous page (`?cursor=`).
+    `?format=ndjson` streams every question of the category
+    (after the cursor, if any) instead.
     '''
     @app.route('/categories/<int:category_id>/questions')
+    @response_cache.cached('questions')
     def get_categories_questions(category_id):
         try:
-            selection = Question.query.filter_by(category=category_id).all()
+            after_id = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            abort(400)
 
-            if len(selection) == 0:
+        try:
+            questions_num = total_questions(category_id)
+
+            if questions_num == 0:
                 abort(404)
 
-            current_questions = paginate_question(request, selection)
+            if request.args.get('format') == 'ndjson':
+                return Response(stream_with_context(export_questions(
+                    category_id=category_id, after_id=after_id)),
+                    mimetype='application/x-ndjson')
+
+            current_questions = list_questions(category_id)
 
             return jsonify({
                 "success": True,
                 "questions": current_questions,
-                "questions_num": len(selection),
+                "questions_num": questions_num,
+                "next_cursor": next_cursor(current_questions),
             })
 
         except Exception:
@@ -205,33 +553,20 @@ def create_app():
     takes category and previous question parameters
     and return a random questions within the given category,
     if provided, and that is not one of the previous questions.
+    The difficulty follows `difficulty` (a target),
+    `difficulty_weights` or `adaptive` with `correct_answers`
+    when given, see quiz_weights.
     '''
     @app.route('/quizzes', methods=['POST'])
     def quizzes():
         try:
             body = request.get_json()
             previous_questions = body.get('previous_questions')
-            quiz_category = body.get('quiz_category')
-            if quiz_category['type'] != "all":
-                category = Category.query\
-                    .filter_by(type=quiz_category['type'])\
-                    .one_or_none()
-                questions = Question.query\
-                    .filter_by(category=category.id).all()
-            else:
-                questions = Question.query.all()
-
-            try:
-                def create_questions_lst(question):
-                    if question.id not in previous_questions:
-                        return question
-                questions_lst = [question
-                                 for question in
-                                 map(create_questions_lst, questions)
-                                 if question is not None]
-                new_question = random.choice(questions_lst).format()
-            except Exception:
-                new_question = None
+            category_id = quiz_category_id(body.get('quiz_category'))
+            weights = quiz_weights(body, question_picker, category_id)
+
+            new_question = pick_question(category_id, previous_questions,
+                                         weights)
 
             return jsonify({
                 'success': True,
@@ -240,6 +575,162 @@ def create_app():
         except Exception:
             abort(422)
 
+    '''
+    Get a whole quiz round at once.
+    takes a category, a number of questions (`questions_num`,
+    5 by default) and optional previous questions, and returns
+    that many distinct random questions of the category
+    (fewer when the category runs out), fetched in one query.
+    '''
+    @app.route('/quizzes/batch', methods=['POST'])
+    def quizzes_batch():
+        try:
+            body = request.get_json()
+            category_id = quiz_category_id(body.get('quiz_category'))
+            questions_num = quiz_batch_size(body)
+
+            questions = sample_questions(category_id, questions_num,
+                                         body.get('previous_questions'))
+
+            return jsonify({
+                'success': True,
+                'questions': questions,
+                'questions_num': len(questions),
+            })
+        except Exception:
+            abort(422)
+
+    '''
+    Start a quiz session.
+    takes a category and an optional number of questions
+    (capped, see quiz_session_size), and stores a shuffled
+    sample of the category on the server so
+    clients don't have to send back the previous questions.
+    '''
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        try:
+            body = request.get_json()
+            category_id = quiz_category_id(body.get('quiz_category'))
+            questions_num = quiz_session_size(body)
+
+            question_ids = question_picker.sample(category_id, questions_num)
+            session_id = session_store.new_id()
+            session_store.set(session_id, {
+                'questions': question_ids,
+                'position': 0,
+            })
+
+            return jsonify({
+                'success': True,
+                'session_id': session_id,
+                'total_questions': len(question_ids),
+            })
+        except Exception:
+            abort(422)
+
+    '''
+    Get the next question of a quiz session,
+    or a null question once the session is exhausted.
+    '''
+    @app.route('/quizzes/sessions/<session_id>/next')
+    def next_quiz_question(session_id):
+        state = session_store.get(session_id)
+        if state is None:
+            abort(404)
+
+        question_ids = state['questions']
+        position = state['position']
+        new_question = None
+        while new_question is None and position < len(question_ids):
+            # skips questions deleted since the session started
+            new_question = fetch_question(question_ids[position])
+            position += 1
+
+        state['position'] = position
+        session_store.set(session_id, state)
+
+        return jsonify({
+            'success': True,
+            'question': new_question,
+            'remaining_questions': len(question_ids) - position,
+        })
+
+    '''
+    Reload the snapshot of the read-only mode from the database,
+    and tell the other workers to reload theirs.
+    '''
+    @app.route('/snapshot/reload', methods=['POST'])
+    def reload_snapshot():
+        if snapshot is None:
+            abort(404)
+
+        total = load_snapshot()
+        if coherency is not None:
+            coherency.publish(snapshot_keys())
+
+        return jsonify({
+            'success': True,
+            'total_questions': total,
+        })
+
+    '''
+    Question counts overall, per difficulty and per category,
+    from the question_stats counters.
+    '''
+    @app.route('/stats')
+    @response_cache.cached('questions', 'categories')
+    def get_stats():
+        summary = stats_summary(question_stats.histogram(),
+                                category_cache.all())
+        summary['success'] = True
+        return jsonify(summary)
+
+    '''
+    Request and database timings in the Prometheus text format.
+    '''
+    @app.route('/metrics')
+    def metrics():
+        return Response(instrumentation.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+    '''
+    Create the tables and indexes of a new database:
+        flask init-db
+    '''
+    @app.cli.command('init-db')
+    def init_database():
+        init_db()
+        click.echo('database initialized')
+
+    '''
+    Recount question_stats after questions were written without
+    going through the API or the models:
+        flask rebuild-stats
+    '''
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats():
+        rebuild_question_stats(db.session)
+        db.session.commit()
+        notify_question_changed('reload', None)
+        click.echo('question stats rebuilt')
+
+    '''
+    Apply the pending schema migrations:
+        flask migrate [--batch-size N]
+    '''
+    @app.cli.command('migrate')
+    @click.option('--batch-size', default=BACKFILL_BATCH_SIZE,
+                  help='Rows updated per transaction by backfills.')
+    def migrate(batch_size):
+        applied = run_migrations(db.engine, batch_size)
+        if applied:
+            notify_question_changed('reload', None)
+        for version in applied:
+            click.echo('applied {}'.format(version))
+        if not applied:
+            click.echo('database is up to date')
+
     '''
     Error handlers
     '''
@@ -267,6 +758,30 @@ def create_app():
             "message": "Bad request"
         }), 400
 
+    @app.errorhandler(405)
+    def method_not_allowed(error):
+        return jsonify({
+            "success": False,
+            "error": 405,
+            "message": "Method not allowed"
+        }), 405
+
+    @app.errorhandler(429)
+    def too_many_requests(error):
+        return jsonify({
+            "success": False,
+            "error": 429,
+            "message": "Too many requests"
+        }), 429, retry_after_headers(error)
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return jsonify({
+            "success": False,
+            "error": 503,
+            "message": "Service unavailable"
+        }), 503, retry_after_headers(error)
+
     @app.errorhandler(500)
     def internal_error(error):
         return jsonify({
@@ -275,4 +790,7 @@ def create_app():
             "message": "Server internal error"
         }), 500
 
+    startup_profile.mark('routes')
+    if STARTUP_PROFILE:
+        startup_profile.log()
     return app
@@ -0,0 +1,602 @@
+import functools
+import time
+
+from sqlalchemy import func, select
+
+from models import (DB_PATH, DB_STATEMENT_TIMEOUT, engine_options,
+                    has_trigram_support, notify_question_changed,
+                    question_stat_statements, rebuild_question_stats,
+                    Question, Category)
+from .pagination import (QUESTIONS_PER_PAGE, CountCache, decode_cursor,
+                         next_cursor, page_window)
+from . import quiz
+from .quiz import (QuestionPicker, question_category_rows, quiz_batch_size,
+                   quiz_session_size, quiz_weights)
+from .sessions import MemorySessionStore
+from .cache import CategoryCache
+from .search import TrigramIndex, search_filter, search_rank
+from .suggest import MAX_SUGGESTIONS, SUGGESTIONS, PrefixIndex
+from .metrics import Instrumentation
+from .bulk import (BULK_CHUNK, EXPORT_CHUNK, RowReader, batch_stats,
+                   parse_bulk_delete, parse_question, validated_batches,
+                   ndjson_lines)
+from . import serialization
+from .serialization import (QUESTION_COLUMNS, CATEGORY_COLUMNS,
+                            CATEGORY_FIELDS, FastJSONMixin, row_dicts)
+from .stats import (total_statement, histogram_statement,
+                    needs_rebuild_statements, stats_summary)
+
+'''
+Async serving mode
+    create_async_app() builds a Quart application with the same
+    routes, JSON shapes and error handlers as create_app, running
+    its queries on SQLAlchemy's asyncio engine (asyncpg for Postgres,
+    aiosqlite for SQLite), so a worker isn't blocked while a query
+    is in flight. Serve it with an ASGI server:
+        hypercorn 'flaskr.asgi:create_async_app()'
+    Needs the packages of requirements-async.txt.
+    The ETag layer, read replicas, the read-only snapshot mode
+    (POST /snapshot/reload), rate limiting and the concurrency cap
+    and the flask CLI commands are WSGI only.
+'''
+
+# routes of create_app the async app doesn't serve
+WSGI_ONLY_ROUTES = {('/snapshot/reload', 'POST')}
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+ERROR_MESSAGES = {
+    400: 'Bad request',
+    404: 'Not found',
+    405: 'Method not allowed',
+    422: 'Unprocessable',
+    429: 'Too many requests',
+    500: 'Server internal error',
+    503: 'Service unavailable',
+}
+
+
+def async_database_url(database_path):
+    scheme, separator, rest = database_path.partition('://')
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+def async_engine_options(database_path):
+    options = engine_options(database_path)
+    if DB_STATEMENT_TIMEOUT and database_path.startswith('postgresql'):
+        # asyncpg takes server settings instead of libpq options
+        options['connect_args'] = {'server_settings': {
+            'statement_timeout': str(DB_STATEMENT_TIMEOUT)}}
+    return options
+
+
+def _loaded_by_hooks(categories=None):
+    raise RuntimeError('in-memory indexes of the async app are filled '
+                       'by its request handlers')
+
+
+def create_async_app(database_path=DB_PATH, session_store=None):
+    try:
+        from quart import Quart, Response, abort, g, jsonify, request
+        from quart.json.provider import DefaultJSONProvider
+        from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+        from sqlalchemy.orm import sessionmaker
+    except ImportError as error:
+        raise RuntimeError('the async app needs the packages of '
+                           'requirements-async.txt') from error
+
+    class JSONProvider(FastJSONMixin, DefaultJSONProvider):
+        pass
+
+    app = Quart(__name__)
+    app.json = JSONProvider(app)
+    # no cap on the body size, like create_app: the bulk import
+    # reads its body as it arrives
+    app.config['MAX_CONTENT_LENGTH'] = None
+    engine = create_async_engine(async_database_url(database_path),
+                                 **async_engine_options(database_path))
+    Session = sessionmaker(engine, class_=AsyncSession,
+                           expire_on_commit=False)
+    app.config['ASYNC_ENGINE'] = engine
+
+    instrumentation = Instrumentation()
+    app.extensions['instrumentation'] = instrumentation
+    count_cache = CountCache()
+    category_cache = CategoryCache(loader=_loaded_by_hooks)
+    app.extensions['category_cache'] = category_cache
+    question_picker = QuestionPicker(loader=_loaded_by_hooks)
+    # used unless the database has pg_trgm, checked by the first search
+    search_index = TrigramIndex(loader=_loaded_by_hooks)
+    trigram_search = None
+    prefix_index = PrefixIndex(loader=_loaded_by_hooks)
+    listeners = [count_cache, question_picker, search_index, prefix_index]
+    if session_store is None:
+        session_store = MemorySessionStore()
+    stats_checked = False
+
+    def session():
+        if 'db_session' not in g:
+            g.db_session = Session()
+        return g.db_session
+
+    def questions_changed(action, question):
+        # the async session doesn't go through Question.insert/delete
+        notify_question_changed(action, question)
+        for listener in listeners:
+            if listener is not None:
+                listener.question_changed(action, question)
+
+    async def ensure_categories():
+        if category_cache.expired:
+            rows = await session().execute(
+                select(*CATEGORY_COLUMNS).order_by(Category.id))
+            category_cache.fill(row_dicts(rows, CATEGORY_FIELDS))
+
+    async def ensure_picker():
+        if not question_picker.loaded:
+            question_picker.fill(
+                await session().run_sync(question_category_rows))
+
+    def reload_picker(sync_session):
+        question_picker.fill(question_category_rows(sync_session))
+
+    async def uses_trigram_search():
+        nonlocal trigram_search
+        if trigram_search is None:
+            trigram_search = await session().run_sync(
+                lambda sync_session: has_trigram_support(
+                    sync_session.connection()))
+        return trigram_search
+
+    async def ensure_search_index():
+        if not search_index.loaded:
+            rows = await session().execute(
+                select(Question.id, Question.question, Question.answer,
+                       Question.category))
+            search_index.fill(rows.all())
+
+    async def ensure_prefix_index():
+        if not prefix_index.loaded:
+            rows = await session().execute(
+                select(Question.id, Question.question, Question.category))
+            prefix_index.fill(rows.all())
+
+    async def ensure_question_stats():
+        nonlocal stats_checked
+        if stats_checked:
+            return
+        any_stat, any_question = needs_rebuild_statements()
+        if (await session().execute(any_stat)).first() is None and \
+                (await session().execute(any_question)).first() is not None:
+            await session().run_sync(rebuild_question_stats)
+            await session().commit()
+        stats_checked = True
+
+    async def add_question_stats(deltas):
+        for statement in question_stat_statements(deltas,
+                                                  engine.dialect.name):
+            await session().execute(statement)
+
+    async def total_questions(category_id=None):
+        return (await session().execute(
+            total_statement(category_id))).scalar()
+
+    async def count_questions(key, statement):
+        value = count_cache.lookup(key)
+        if value is None:
+            value = (await session().execute(
+                select(func.count()).select_from(
+                    statement.order_by(None).subquery()))).scalar()
+            count_cache.store(key, value)
+        return value
+
+    async def paginate_question(statement, order_by=(Question.id,),
+                                keyset=True):
+        after_id, offset = page_window(request.args, keyset)
+        if after_id is not None:
+            statement = statement.where(Question.id > after_id)\
+                .order_by(Question.id)
+        elif offset is None:
+            return []
+        else:
+            statement = statement.order_by(*order_by).offset(offset)
+        rows = await session().execute(
+            statement.with_only_columns(*QUESTION_COLUMNS)
+            .limit(QUESTIONS_PER_PAGE))
+        return row_dicts(rows)
+
+    async def fetch_questions(question_ids):
+        return await session().run_sync(
+            lambda sync_session: serialization.fetch_questions(
+                question_ids, sync_session))
+
+    async def fetch_question(question_id):
+        questions = await fetch_questions([question_id])
+        return questions[0] if questions else None
+
+    async def write_response(response):
+        response['total_questions'] = await total_questions()
+        if request.args.get('include_page', 0, type=int):
+            response['questions'] = await paginate_question(select(Question))
+        return response
+
+    def quiz_category_id(quiz_category):
+        if quiz_category['type'] == "all":
+            return None
+        category_id = category_cache.id_for(quiz_category['type'])
+        if category_id is None:
+            abort(422)
+        return category_id
+
+    @app.before_request
+    async def before_request():
+        g.request_start = time.perf_counter()
+        await ensure_categories()
+        await ensure_question_stats()
+
+    @app.after_request
+    async def after_request(response):
+        response.headers.add('Access-Control-Allow-Origin', '*')
+        response.headers.add('Access-Control-Allow-Headers',
+                             'Content-Type, Authorization')
+        response.headers.add('Access-Control-Allow-Methods',
+                             'GET, POST, PATCH, DELETE, OPTIONS')
+        if 'request_start' in g:
+            seconds = time.perf_counter() - g.request_start
+            route = request.url_rule.rule if request.url_rule \
+                else 'unmatched'
+            instrumentation.record(request.method, route,
+                                   response.status_code, seconds, 0.0, 0)
+            response.headers.add('Server-Timing',
+                                 'app;dur={:.2f}'.format(seconds * 1000))
+        return response
+
+    @app.teardown_appcontext
+    async def close_session(exception):
+        db_session = g.pop('db_session', None)
+        if db_session is not None:
+            await db_session.close()
+
+    @app.route('/categories')
+    async def get_categories():
+        return jsonify({
+            'success': True,
+            'categories': category_cache.all(),
+        })
+
+    @app.route('/questions')
+    async def get_questions():
+        current_questions = await paginate_question(select(Question))
+
+        if len(current_questions) == 0:
+            abort(404)
+
+        return jsonify({
+            'success': True,
+            'questions': current_questions,
+            'categories': category_cache.all(),
+            'total_questions': await total_questions(),
+        })
+
+    @app.route('/questions/<int:question_id>', methods=['DELETE'])
+    async def delete_question(question_id):
+        try:
+            question = await session().get(Question, question_id)
+
+            if question is None:
+                abort(404)
+
+            deltas = question.stat_deltas('delete')
+            await session().delete(question)
+            await add_question_stats(deltas)
+            await session().commit()
+            questions_changed('delete', question)
+
+            return jsonify(await write_response({
+                "success": True,
+                "deleted": question_id,
+            }))
+        except Exception:
+            abort(422)
+
+    @app.route('/questions', methods=['DELETE'])
+    async def bulk_delete_questions():
+        try:
+            ids, category = parse_bulk_delete(await request.get_json())
+            deltas = await session().run_sync(
+                Question.delete_matching, ids, category)
+            if deltas:
+                await add_question_stats(deltas)
+                await session().commit()
+                questions_changed('reload', None)
+
+            return jsonify(await write_response({
+                'success': True,
+                'deleted': -sum(deltas.values()),
+            }))
+        except Exception:
+            abort(422)
+
+    @app.route('/questions', methods=['POST'])
+    async def create_question():
+        body = await request.get_json()
+        try:
+            question = Question(**parse_question(body, category_cache))
+            session().add(question)
+            await add_question_stats(question.stat_deltas('insert'))
+            await session().commit()
+            questions_changed('insert', question)
+
+            return jsonify(await write_response({
+                'success': True,
+                'created': question.id,
+            }))
+        except Exception:
+            abort(422)
+
+    @app.route('/questions/bulk', methods=['POST'])
+    async def bulk_create_questions():
+        reader = RowReader(request.mimetype)
+        imported = 0
+        errors = []
+
+        async def import_rows(rows, first_row):
+            nonlocal imported
+            for batch in validated_batches(rows, category_cache, errors,
+                                           first_row=first_row):
+                await session().execute(Question.__table__.insert(), batch)
+                await add_question_stats(batch_stats(batch))
+                await session().commit()
+                imported += len(batch)
+
+        # rows are parsed as the body arrives, BULK_CHUNK at a time
+        rows = []
+        first_row = 1
+        async for chunk in request.body:
+            rows.extend(reader.feed(chunk))
+            if len(rows) >= BULK_CHUNK:
+                await import_rows(rows, first_row)
+                first_row += len(rows)
+                rows = []
+        rows.extend(reader.close())
+        await import_rows(rows, first_row)
+
+        if imported:
+            questions_changed('reload', None)
+        if imported == 0 and errors:
+            abort(422)
+
+        return jsonify({
+            'success': True,
+            'imported': imported,
+            'errors': errors,
+        })
+
+    def stream_questions(category_id=None, after_id=None):
+        statement = select(*QUESTION_COLUMNS).order_by(Question.id)
+        if category_id is not None:
+            statement = statement.where(Question.category == category_id)
+        if after_id is not None:
+            statement = statement.where(Question.id > after_id)
+
+        async def generate():
+            # the stream outlives the request, it gets its own session
+            async with Session() as export_session:
+                result = await export_session.stream(
+                    statement.execution_options(yield_per=EXPORT_CHUNK))
+                async for partition in result.partitions(EXPORT_CHUNK):
+                    yield ndjson_lines(partition)
+
+        return Response(generate(), mimetype='application/x-ndjson')
+
+    @app.route('/questions/export')
+    async def export_all_questions():
+        return stream_questions()
+
+    @app.route('/questions/suggest')
+    async def suggest_questions():
+        prefix = request.args.get('prefix', '')
+        limit = request.args.get('limit', SUGGESTIONS, type=int)
+        if not prefix.strip() or not 1 <= limit <= MAX_SUGGESTIONS:
+            abort(400)
+
+        await ensure_prefix_index()
+        return jsonify({
+            'success': True,
+            'suggestions': prefix_index.suggest(prefix, limit),
+        })
+
+    @app.route('/questions/search', methods=['POST'])
+    async def search_questions():
+        body = await request.get_json()
+        try:
+            question_param = body.get('searchTerm')
+            include_answers = bool(body.get('searchAnswers', False))
+            if not await uses_trigram_search():
+                await ensure_search_index()
+                ids = search_index.search(question_param, include_answers)
+                _, offset = page_window(request.args, False)
+                page_ids = ids[offset:offset + QUESTIONS_PER_PAGE] \
+                    if offset is not None else []
+                current_questions = await fetch_questions(page_ids)
+                questions_num = len(ids)
+            else:
+                selection = select(Question).where(
+                    search_filter(question_param, include_answers))
+                current_questions = await paginate_question(
+                    selection,
+                    order_by=(search_rank(question_param, include_answers),
+                              Question.id),
+                    keyset=False)
+                questions_num = await count_questions(
+                    ('search', question_param, include_answers), selection)
+
+            if len(current_questions) == 0:
+                abort(404)
+
+            return jsonify({
+                "success": True,
+                "questions": current_questions,
+                "questions_num": questions_num,
+            })
+        except Exception:
+            abort(404)
+
+    @app.route('/categories/<int:category_id>/questions')
+    async def get_categories_questions(category_id):
+        try:
+            after_id = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            abort(400)
+
+        try:
+            selection = select(Question).where(
+                Question.category == category_id)
+            questions_num = await total_questions(category_id)
+
+            if questions_num == 0:
+                abort(404)
+
+            if request.args.get('format') == 'ndjson':
+                return stream_questions(category_id, after_id)
+
+            current_questions = await paginate_question(selection)
+
+            return jsonify({
+                "success": True,
+                "questions": current_questions,
+                "questions_num": questions_num,
+                "next_cursor": next_cursor(current_questions),
+            })
+        except Exception:
+            abort(404)
+
+    async def pick_question(category_id, previous_questions, weights=None):
+        return await session().run_sync(
+            lambda sync_session: quiz.pick_question(
+                question_picker,
+                functools.partial(serialization.fetch_question,
+                                  session=sync_session),
+                functools.partial(reload_picker, sync_session),
+                category_id, previous_questions, weights))
+
+    @app.route('/quizzes', methods=['POST'])
+    async def quizzes():
+        try:
+            body = await request.get_json()
+            category_id = quiz_category_id(body.get('quiz_category'))
+            await ensure_picker()
+            weights = quiz_weights(body, question_picker, category_id)
+
+            return jsonify({
+                'success': True,
+                'question': await pick_question(
+                    category_id, body.get('previous_questions'), weights),
+            })
+        except Exception:
+            abort(422)
+
+    async def sample_questions(category_id, questions_num,
+                               previous_questions):
+        return await session().run_sync(
+            lambda sync_session: quiz.sample_questions(
+                question_picker,
+                functools.partial(serialization.fetch_questions,
+                                  session=sync_session),
+                functools.partial(reload_picker, sync_session),
+                category_id, questions_num, previous_questions))
+
+    @app.route('/quizzes/batch', methods=['POST'])
+    async def quizzes_batch():
+        try:
+            body = await request.get_json()
+            category_id = quiz_category_id(body.get('quiz_category'))
+            questions_num = quiz_batch_size(body)
+            await ensure_picker()
+
+            questions = await sample_questions(
+                category_id, questions_num, body.get('previous_questions'))
+
+            return jsonify({
+                'success': True,
+                'questions': questions,
+                'questions_num': len(questions),
+            })
+        except Exception:
+            abort(422)
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    async def create_quiz_session():
+        try:
+            body = await request.get_json()
+            category_id = quiz_category_id(body.get('quiz_category'))
+            questions_num = quiz_session_size(body)
+
+            await ensure_picker()
+            question_ids = question_picker.sample(category_id, questions_num)
+            session_id = session_store.new_id()
+            session_store.set(session_id, {
+                'questions': question_ids,
+                'position': 0,
+            })
+
+            return jsonify({
+                'success': True,
+                'session_id': session_id,
+                'total_questions': len(question_ids),
+            })
+        except Exception:
+            abort(422)
+
+    @app.route('/quizzes/sessions/<session_id>/next')
+    async def next_quiz_question(session_id):
+        state = session_store.get(session_id)
+        if state is None:
+            abort(404)
+
+        question_ids = state['questions']
+        position = state['position']
+        new_question = None
+        while new_question is None and position < len(question_ids):
+            # skips questions deleted since the session started
+            new_question = await fetch_question(question_ids[position])
+            position += 1
+
+        state['position'] = position
+        session_store.set(session_id, state)
+
+        return jsonify({
+            'success': True,
+            'question': new_question,
+            'remaining_questions': len(question_ids) - position,
+        })
+
+    @app.route('/stats')
+    async def get_stats():
+        rows = await session().execute(histogram_statement())
+        summary = stats_summary(rows.all(), category_cache.all())
+        summary['success'] = True
+        return jsonify(summary)
+
+    @app.route('/metrics')
+    async def metrics():
+        return Response(instrumentation.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+    def error_handler(code):
+        async def handle(error):
+            return jsonify({
+                "success": False,
+                "error": code,
+                "message": ERROR_MESSAGES[code],
+            }), code
+        return handle
+
+    for code in ERROR_MESSAGES:
+        app.register_error_handler(code, error_handler(code))
+
+    return app
@@ -0,0 +1,264 @@
+import csv
+import json
+from collections import Counter, deque
+
+from sqlalchemy import select
+
+from models import db, Question, stat_key
+from .serialization import QUESTION_COLUMNS, QUESTION_FIELDS, dumps
+
+BULK_CHUNK = 1000
+MAX_BULK_DELETE_IDS = 1000
+EXPORT_CHUNK = 1000
+MAX_REPORTED_ERRORS = 100
+
+
+'''
+parse_question(data, category_cache)
+    validated column values of a new question, or ValueError.
+    Shared by POST /questions and the bulk import.
+'''
+
+
+def parse_question(data, category_cache):
+    question = data.get('question')
+    if not question:
+        raise ValueError('question is required')
+    if not isinstance(question, str):
+        raise ValueError('question must be a string')
+
+    answer = data.get('answer')
+    if not answer:
+        raise ValueError('answer is required')
+    if not isinstance(answer, str):
+        raise ValueError('answer must be a string')
+
+    difficulty = int(data.get('difficulty'))
+    if difficulty < 1:
+        raise ValueError('difficulty must be positive')
+
+    category = int(data.get('category'))
+    if category_cache.type_for(category) is None:
+        raise ValueError('unknown category')
+
+    return {
+        'question': question,
+        'answer': answer,
+        'category': category,
+        'difficulty': difficulty,
+    }
+
+
+'''
+parse_bulk_delete(data)
+    (ids, category) filters of a bulk delete, at least one of them
+    set, or ValueError.
+'''
+
+
+def parse_bulk_delete(data):
+    ids = data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) > MAX_BULK_DELETE_IDS:
+            raise ValueError('ids must be a list of at most {} ids'
+                             .format(MAX_BULK_DELETE_IDS))
+        ids = [int(question_id) for question_id in ids]
+
+    category = data.get('category')
+    if category is not None:
+        category = int(category)
+
+    if ids is None and category is None:
+        raise ValueError('ids or category is required')
+    return ids, category
+
+
+'''
+RowReader(content_type)
+    push parser of an NDJSON (default) or CSV (text/csv) upload:
+    feed(chunk) takes the next bytes of the body and returns the
+    rows of the lines (CSV records) they completed, close() the
+    rows of what is left. Lines that aren't valid JSON come out as
+    None, rows that aren't valid UTF-8 as a ValueError.
+    A CSV record ends at a newline outside quotes, i.e. once it
+    holds an even number of '"' (quotes are escaped by doubling).
+'''
+
+INVALID_UTF8 = 'row is not valid UTF-8'
+READ_CHUNK = 64 * 1024
+
+
+def _valid_utf8(text):
+    # undecodable bytes were kept as lone surrogates
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+class _Lines:
+    # input of the csv reader, which picks up again after running dry
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+class RowReader:
+
+    def __init__(self, content_type):
+        self._pending = []
+        self._csv_lines = None
+        self._record = []
+        self._quotes = 0
+        if content_type == 'text/csv':
+            self._csv_lines = _Lines()
+            self._csv_rows = csv.DictReader(self._csv_lines)
+
+    def feed(self, chunk):
+        self._pending.append(chunk)
+        if b'\n' not in chunk:
+            return []
+        lines = b''.join(self._pending).split(b'\n')
+        self._pending = [lines.pop()]
+        return self._rows(lines)
+
+    def close(self):
+        rest = b''.join(self._pending)
+        self._pending = []
+        return self._rows([rest] if rest else [], final=True)
+
+    def _rows(self, lines, final=False):
+        if self._csv_lines is None:
+            return [self._json_row(line) for line in lines if line.strip()]
+
+        for line in lines:
+            text = line.decode('utf-8', 'surrogateescape') + '\n'
+            self._record.append(text)
+            self._quotes += text.count('"')
+            if self._quotes % 2 == 0:
+                self._csv_lines.lines.extend(self._record)
+                self._record, self._quotes = [], 0
+        if final:
+            # an unterminated quoted field, parsed as far as it goes
+            self._csv_lines.lines.extend(self._record)
+            self._record = []
+        return [row if all(_valid_utf8(value) for value in row.values()
+                           if isinstance(value, str))
+                else ValueError(INVALID_UTF8)
+                for row in self._csv_rows]
+
+    @staticmethod
+    def _json_row(line):
+        try:
+            line = line.decode('utf-8')
+        except UnicodeDecodeError:
+            return ValueError(INVALID_UTF8)
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+
+'''
+read_rows(stream, content_type)
+    lazily decodes an upload read from a file-like stream with a
+    RowReader, READ_CHUNK bytes at a time.
+'''
+
+
+def read_rows(stream, content_type, chunk_size=READ_CHUNK):
+    reader = RowReader(content_type)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        yield from reader.feed(chunk)
+    yield from reader.close()
+
+
+'''
+validated_batches(rows, category_cache, errors)
+    lists of at most chunk_size valid rows. Invalid rows are skipped
+    and added to `errors` by their row number, counted from
+    first_row (1 unless the rows continue an upload).
+'''
+
+
+def validated_batches(rows, category_cache, errors, chunk_size=BULK_CHUNK,
+                      first_row=1):
+    batch = []
+    for row_number, row in enumerate(rows, start=first_row):
+        try:
+            if isinstance(row, ValueError):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError('row must be an object')
+            batch.append(parse_question(row, category_cache))
+        except (ValueError, TypeError) as error:
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'row': row_number, 'message': str(error)})
+            continue
+
+        if len(batch) >= chunk_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def batch_stats(batch):
+    return Counter(stat_key(row['category'], row['difficulty'])
+                   for row in batch)
+
+
+'''
+import_questions(rows, category_cache)
+    validates and inserts rows with Question.bulk_insert(), one
+    transaction per BULK_CHUNK rows, together with their
+    question_stats deltas.
+'''
+
+
+def import_questions(rows, category_cache, chunk_size=BULK_CHUNK):
+    errors = []
+    imported = Question.bulk_insert(
+        (row for batch in validated_batches(rows, category_cache, errors,
+                                            chunk_size)
+         for row in batch), chunk_size)
+    return imported, errors
+
+
+def ndjson_lines(rows):
+    return b''.join(dumps(dict(zip(QUESTION_FIELDS, row))) + b'\n'
+                    for row in rows)
+
+
+'''
+export_questions(category_id, after_id)
+    generator of NDJSON lines of every question ordered by id (of
+    one category and after an id, when given), fetched through a
+    server-side cursor EXPORT_CHUNK rows at a time.
+'''
+
+
+def export_questions(chunk_size=EXPORT_CHUNK, category_id=None,
+                     after_id=None):
+    statement = select(*QUESTION_COLUMNS)
+    if category_id is not None:
+        statement = statement.where(Question.category == category_id)
+    if after_id is not None:
+        statement = statement.where(Question.id > after_id)
+    statement = statement.order_by(Question.id)\
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    result = db.session.execute(statement)
+    try:
+        for partition in result.partitions(chunk_size):
+            yield ndjson_lines(partition)
+    finally:
+        result.close()
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+from models import db, reads_from_primary, table_versions, Category
+from .serialization import CATEGORY_COLUMNS, CATEGORY_FIELDS, row_dicts
+
+CATEGORY_CACHE_TTL = int(os.getenv('CATEGORY_CACHE_TTL', 300))
+
+
+'''
+CategoryCache
+    read-through, process-level cache of the categories table.
+    Keeps the formatted categories with an id -> type map and a
+    type -> id index, loaded on first use (or given to fill()),
+    reloaded after `ttl` seconds (never when
+    ttl is None) or after an explicit invalidate(). Both bump
+    the categories table version.
+    `hits` and `misses` count lookups served from memory and
+    reloads from the database.
+'''
+
+
+@reads_from_primary
+def load_categories():
+    rows = db.session.query(*CATEGORY_COLUMNS).order_by(Category.id).all()
+    return row_dicts(rows, CATEGORY_FIELDS)
+
+
+class CategoryCache:
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL, clock=time.monotonic,
+                 loader=load_categories):
+        self.ttl = ttl
+        self.clock = clock
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entry = None
+        self._expires = 0
+
+    @staticmethod
+    def _index(formatted):
+        return {
+            'formatted': formatted,
+            'types': {c['id']: c['type'] for c in formatted},
+            'ids': {c['type']: c['id'] for c in formatted},
+        }
+
+    def _expired(self):
+        return self._entry is None or \
+            (self.ttl is not None and self._expires <= self.clock())
+
+    def _fill(self, formatted):
+        self.misses += 1
+        if self._entry is not None:
+            table_versions.bump('categories')
+        self._entry = self._index(formatted)
+        self._expires = self.clock() + (self.ttl or 0)
+
+    def _get(self):
+        with self._lock:
+            if self._expired():
+                self._fill(self.loader())
+            else:
+                self.hits += 1
+            return self._entry
+
+    @property
+    def expired(self):
+        with self._lock:
+            return self._expired()
+
+    def fill(self, formatted):
+        with self._lock:
+            self._fill(formatted)
+
+    def all(self):
+        return self._get()['formatted']
+
+    def type_for(self, category_id):
+        return self._get()['types'].get(category_id)
+
+    def id_for(self, category_type):
+        return self._get()['ids'].get(category_type)
+
+    def invalidate(self):
+        with self._lock:
+            self._entry = None
+        table_versions.bump('categories')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,150 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+# file of shared version counters, unset keeps caches per process
+CACHE_VERSIONS_PATH = os.getenv('CACHE_VERSIONS_PATH')
+VERSION_SLOTS = 1024
+_COUNTER = struct.Struct('<Q')
+
+
+'''
+VersionStore
+    interface of the counters workers use to tell each other that
+    a slice of their caches went stale. bump(key) increments and
+    returns the counter of a key, snapshot() returns every counter
+    as bytes that compare cheaply, and slot_value(snapshot, key)
+    reads one counter back from a snapshot.
+    A Postgres backend could bump with NOTIFY and keep the counters
+    up to date from LISTEN, with the same three methods.
+'''
+
+
+class VersionStore:
+
+    def bump(self, key):
+        raise NotImplementedError
+
+    def snapshot(self):
+        raise NotImplementedError
+
+    def slot_value(self, snapshot, key):
+        raise NotImplementedError
+
+
+'''
+SharedMemoryVersionStore(path)
+    counters in a memory-mapped file shared by the workers of a
+    host (e.g. gunicorn workers). Keys are hashed into `slots`
+    64-bit counters, a collision only costs a spurious rebuild.
+    Increments hold an exclusive lock on the file (fcntl), reads
+    don't lock. Without fcntl the lock only covers this process.
+'''
+
+
+class SharedMemoryVersionStore(VersionStore):
+
+    def __init__(self, path, slots=VERSION_SLOTS):
+        self.slots = slots
+        self._lock = threading.Lock()
+        size = slots * _COUNTER.size
+        self._file = open(path, 'a+b')
+        if os.path.getsize(path) < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def _offset(self, key):
+        return zlib.crc32(key.encode()) % self.slots * _COUNTER.size
+
+    def bump(self, key):
+        offset = self._offset(key)
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                value = _COUNTER.unpack_from(self._map, offset)[0] + 1
+                _COUNTER.pack_into(self._map, offset, value)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+        return value
+
+    def snapshot(self):
+        return self._map[:]
+
+    def slot_value(self, snapshot, key):
+        return _COUNTER.unpack_from(snapshot, self._offset(key))[0]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+'''
+CacheCoherency(store)
+    keeps the in-process caches of a worker in line with the writes
+    of the other workers.
+    As a question listener it publishes the slices a local write
+    touched: 'questions' for every write, plus 'questions:<category>'
+    for a single question or 'questions:*' for bulk changes.
+    poll() (before each request) compares the store with the last
+    snapshot, a single memcmp when nothing changed, and calls
+    the handlers of the keys that changed, given by watch(keys_fn,
+    handler). Changes made by this process alone are skipped, its
+    listeners already applied them.
+'''
+
+
+class CacheCoherency:
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self._snapshot = store.snapshot()
+        self._own = Counter()
+        self._watches = []
+
+    @staticmethod
+    def question_keys(action, question):
+        if action in ('insert', 'delete') and question is not None:
+            return ['questions', 'questions:{}'.format(question.category)]
+        return ['questions', 'questions:*']
+
+    def watch(self, keys, handler):
+        self._watches.append((keys, handler))
+
+    def publish(self, keys):
+        for key in keys:
+            self.store.bump(key)
+            with self._lock:
+                self._own[key] += 1
+
+    def question_changed(self, action, question):
+        self.publish(self.question_keys(action, question))
+
+    def poll(self):
+        current = self.store.snapshot()
+        with self._lock:
+            if current == self._snapshot:
+                return []
+            previous, self._snapshot = self._snapshot, current
+            own, self._own = self._own, Counter()
+
+        changed = []
+        for keys, handler in self._watches:
+            for key in keys():
+                delta = self.store.slot_value(current, key) - \
+                    self.store.slot_value(previous, key)
+                # changes made by this process were applied locally
+                if delta and delta != own[key]:
+                    changed.append(key)
+                    handler(key)
+        return changed
@@ -0,0 +1,93 @@
+import functools
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+from flask import Response, request
+
+from models import table_versions
+
+# serialized bodies kept in memory, 0 disables the body cache
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 0))
+CACHE_CONTROL = 'no-cache'
+
+
+'''
+ResponseCache
+    conditional GET support for read endpoints.
+    A response's ETag is derived from the versions of the tables it
+    reads, so `If-None-Match` is answered with 304 without touching
+    the database. Versions are per process, the ETag carries a
+    process token so tags from another worker never match.
+    Only a process told of the other workers' writes (a shared
+    version store, see coherency) can trust its versions, so
+    without shared_versions no ETag is sent and nothing is cached.
+    With max_entries > 0 the serialized 200 bodies are also kept in
+    a bounded LRU keyed by route, query args and ETag (streamed
+    responses excepted).
+'''
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, shared_versions=True):
+        self.max_entries = max_entries
+        self.shared_versions = shared_versions
+        self.hits = 0
+        self.not_modified = 0
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._bodies = OrderedDict()
+
+    def etag(self, tables):
+        return '{}-{}'.format(self._token, '.'.join(
+            str(table_versions.get(table)) for table in tables))
+
+    def _get_body(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                self.hits += 1
+            return body
+
+    def _set_body(self, key, body):
+        with self._lock:
+            self._bodies[key] = body
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+    def cached(self, *tables):
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.shared_versions:
+                    response = view(*args, **kwargs)
+                    if response.status_code == 200:
+                        response.headers['Cache-Control'] = CACHE_CONTROL
+                    return response
+                etag = self.etag(tables)
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    response = Response(status=304)
+                else:
+                    key = (request.path,
+                           tuple(sorted(request.args.items(multi=True))),
+                           etag)
+                    body = self._get_body(key) if self.max_entries else None
+                    if body is not None:
+                        response = Response(body,
+                                            mimetype='application/json')
+                    else:
+                        response = view(*args, **kwargs)
+                        if response.status_code != 200:
+                            return response
+                        if self.max_entries and not response.is_streamed:
+                            self._set_body(key, response.get_data())
+
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = CACHE_CONTROL
+                return response
+            return wrapper
+        return decorator
@@ -0,0 +1,167 @@
+import bisect
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# milliseconds, 0 disables the slow query log
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 0))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger(__name__)
+
+
+'''
+SQL statement timing
+    engine event listeners, registered once for every engine, adding
+    the duration of each statement run during a request to
+    g.db_seconds and g.db_statements.
+'''
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context() and 'db_seconds' in g:
+        g.db_seconds += elapsed
+        g.db_statements += 1
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning('slow query (%.1f ms): %s', elapsed * 1000, statement)
+
+
+_listening = False
+
+
+def _listen_to_engines():
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+class _RouteStats:
+
+    def __init__(self):
+        self.requests = {}
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.db_statements = 0
+        self.count = 0
+
+
+'''
+Instrumentation
+    per-route wall time, database time and statement count.
+    Every response gets a Server-Timing header, and render() gives
+    the totals in the Prometheus text format for GET /metrics.
+    Other values (e.g. cache counters) are exported with add_metric().
+'''
+
+
+class Instrumentation:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._metrics = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        _listen_to_engines()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.extensions['instrumentation'] = self
+
+    def add_metric(self, name, metric_type, help_text, collect):
+        self._metrics.append((name, metric_type, help_text, collect))
+
+    def _start(self):
+        g.request_start = time.perf_counter()
+        g.db_seconds = 0.0
+        g.db_statements = 0
+
+    def _finish(self, response):
+        if 'request_start' not in g:
+            return response
+        seconds = time.perf_counter() - g.request_start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.record(request.method, route, response.status_code,
+                    seconds, g.db_seconds, g.db_statements)
+
+        response.headers.add('Server-Timing', (
+            'app;dur={:.2f}, db;dur={:.2f};desc="{} statements"'.format(
+                seconds * 1000, g.db_seconds * 1000, g.db_statements)))
+        return response
+
+    def record(self, method, route, status, seconds, db_seconds,
+               db_statements):
+        with self._lock:
+            stats = self._routes.setdefault((method, route), _RouteStats())
+            stats.requests[status] = stats.requests.get(status, 0) + 1
+            bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+            if bucket < len(LATENCY_BUCKETS):
+                stats.buckets[bucket] += 1
+            stats.seconds += seconds
+            stats.db_seconds += db_seconds
+            stats.db_statements += db_statements
+            stats.count += 1
+
+    def render(self):
+        lines = [
+            '# HELP trivia_requests_total Requests served.',
+            '# TYPE trivia_requests_total counter',
+        ]
+        histogram = [
+            '# HELP trivia_request_duration_seconds Request wall time.',
+            '# TYPE trivia_request_duration_seconds histogram',
+        ]
+        db_seconds = [
+            '# HELP trivia_db_seconds_total Time spent in SQL statements.',
+            '# TYPE trivia_db_seconds_total counter',
+        ]
+        db_statements = [
+            '# HELP trivia_db_statements_total SQL statements executed.',
+            '# TYPE trivia_db_statements_total counter',
+        ]
+        with self._lock:
+            for (method, route), stats in sorted(self._routes.items()):
+                labels = 'method="{}",route="{}"'.format(method, route)
+                for status, count in sorted(stats.requests.items()):
+                    lines.append('trivia_requests_total{{{},status="{}"}} {}'
+                                 .format(labels, status, count))
+                cumulative = 0
+                for le, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    histogram.append(
+                        'trivia_request_duration_seconds_bucket'
+                        '{{{},le="{}"}} {}'.format(labels, le, cumulative))
+                histogram.append(
+                    'trivia_request_duration_seconds_bucket'
+                    '{{{},le="+Inf"}} {}'.format(labels, stats.count))
+                histogram.append('trivia_request_duration_seconds_sum{{{}}} '
+                                 '{:.6f}'.format(labels, stats.seconds))
+                histogram.append('trivia_request_duration_seconds_count{{{}}} '
+                                 '{}'.format(labels, stats.count))
+                db_seconds.append('trivia_db_seconds_total{{{}}} {:.6f}'
+                                  .format(labels, stats.db_seconds))
+                db_statements.append('trivia_db_statements_total{{{}}} {}'
+                                     .format(labels, stats.db_statements))
+
+        lines += histogram + db_seconds + db_statements
+        for name, metric_type, help_text, collect in self._metrics:
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.append('{} {}'.format(name, collect()))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,163 @@
+import base64
+import binascii
+import threading
+import time
+
+from .serialization import QUESTION_COLUMNS, row_dicts
+
+QUESTIONS_PER_PAGE = 10
+COUNT_CACHE_TTL = 30
+CURSOR_PREFIX = 'q:'
+
+
+'''
+CountCache
+    small thread-safe TTL cache for COUNT(*) results, keyed by
+    an arbitrary hashable (e.g. ('search', term, answers)).
+    Writes call clear() so counts never outlive a change made
+    through this process.
+'''
+
+
+class CountCache:
+
+    def __init__(self, ttl=COUNT_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+        return None
+
+    def store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+
+    def get(self, key, compute):
+        value = self.lookup(key)
+        if value is None:
+            value = compute()
+            self.store(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def question_changed(self, action, question):
+        self.clear()
+
+
+'''
+encode_cursor(last_id), decode_cursor(cursor)
+    opaque page cursors carrying the last id of a page, so
+    clients don't depend on how a page is located. decode_cursor()
+    returns None for no cursor and raises ValueError for a
+    malformed one.
+'''
+
+
+def encode_cursor(last_id):
+    token = '{}{}'.format(CURSOR_PREFIX, int(last_id)).encode()
+    return base64.urlsafe_b64encode(token).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    if cursor is None:
+        return None
+    try:
+        token = base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)).decode()
+    except (binascii.Error, UnicodeError):
+        raise ValueError('invalid cursor')
+    if not token.startswith(CURSOR_PREFIX):
+        raise ValueError('invalid cursor')
+    return int(token[len(CURSOR_PREFIX):])
+
+
+'''
+next_cursor(rows)
+    the cursor of the page after rows, None after a short page.
+'''
+
+
+def next_cursor(rows, per_page=QUESTIONS_PER_PAGE):
+    if len(rows) < per_page:
+        return None
+    return encode_cursor(rows[-1]['id'])
+
+
+'''
+page_window(args, keyset)
+    (after_id, offset) of the requested page: after_id is set in
+    keyset mode (`?cursor=` or `?after_id=`, when the listing
+    supports it), otherwise offset is the LIMIT/OFFSET start, or
+    None for an invalid page.
+'''
+
+
+def page_window(args, keyset=True, per_page=QUESTIONS_PER_PAGE):
+    after_id = decode_cursor(args.get('cursor', None))
+    if after_id is None:
+        after_id = args.get('after_id', None, type=int)
+    if after_id is not None and keyset:
+        return after_id, None
+
+    page = args.get('page', 1, type=int)
+    if page < 1:
+        return None, None
+    return None, (page - 1) * per_page
+
+
+'''
+paginate_query(request, query, order_by, keyset_column)
+    returns the rows of the requested page as dicts, fetched with
+    LIMIT/OFFSET in SQL. Only `columns` are selected, as tuples.
+    When a cursor is given and the query is keyset-capable
+    (keyset_column is set), rows are fetched with
+    `WHERE keyset_column > after_id` instead, so deep pages cost
+    the same as the first one.
+'''
+
+
+def paginate_query(request, query, order_by, keyset_column=None,
+                   per_page=QUESTIONS_PER_PAGE, columns=QUESTION_COLUMNS):
+    after_id, offset = page_window(request.args, keyset_column is not None,
+                                   per_page)
+    if after_id is not None:
+        query = query.filter(keyset_column > after_id)\
+            .order_by(keyset_column)
+    elif offset is None:
+        return []
+    else:
+        query = query.order_by(*order_by).offset(offset)
+
+    rows = query.with_entities(*columns).limit(per_page).all()
+    return row_dicts(rows, [column.key for column in columns])
+
+
+'''
+paginate_ids(request, ids)
+    the requested page of an already ranked list of ids.
+'''
+
+
+def paginate_ids(request, ids, per_page=QUESTIONS_PER_PAGE):
+    _, offset = page_window(request.args, False, per_page)
+    if offset is None:
+        return []
+    return ids[offset:offset + per_page]
+
+
+'''
+count_query(cache, key, query)
+    cached COUNT(*) of a query, without its ORDER BY.
+'''
+
+
+def count_query(cache, key, query):
+    return cache.get(key, lambda: query.order_by(None).count())
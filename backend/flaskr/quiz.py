@@ -0,0 +1,410 @@
+import os
+import random
+import threading
+from collections import OrderedDict
+
+from models import db, reads_from_primary, Question
+
+MAX_PICK_ATTEMPTS = 32
+# questions of a quiz round, see POST /quizzes/batch
+QUIZ_BATCH_SIZE = 5
+MAX_QUIZ_BATCH = 50
+# questions kept for a quiz session, see POST /quizzes/sessions
+QUIZ_SESSION_SIZE = int(os.getenv('QUIZ_SESSION_SIZE', 10))
+MAX_QUIZ_SESSION = int(os.getenv('MAX_QUIZ_SESSION', 100))
+# weight of a difficulty one step away from the target, two steps
+# away gets DIFFICULTY_SPREAD ** 2 and so on
+DIFFICULTY_SPREAD = 0.25
+ADAPTIVE_STEP = 1
+# alias tables kept per picker, the weights come from the requests
+MAX_ALIAS_TABLES = 256
+
+
+'''
+quiz_batch_size(body)
+    the number of questions asked for by a batch quiz request
+    (`questions_num`, QUIZ_BATCH_SIZE by default). Raises
+    ValueError outside of 1..MAX_QUIZ_BATCH.
+'''
+
+
+def quiz_batch_size(body):
+    questions_num = int(body.get('questions_num', QUIZ_BATCH_SIZE))
+    if not 1 <= questions_num <= MAX_QUIZ_BATCH:
+        raise ValueError('questions_num must be between 1 and {}'
+                         .format(MAX_QUIZ_BATCH))
+    return questions_num
+
+
+'''
+quiz_session_size(body)
+    the number of questions of a new quiz session (`questions_num`,
+    QUIZ_SESSION_SIZE by default), at most MAX_QUIZ_SESSION so the
+    stored sessions stay small. Raises ValueError below 1.
+'''
+
+
+def quiz_session_size(body):
+    questions_num = int(body.get('questions_num', QUIZ_SESSION_SIZE))
+    if questions_num < 1:
+        raise ValueError('questions_num must be positive')
+    return min(questions_num, MAX_QUIZ_SESSION)
+
+
+'''
+QuestionPicker
+    picks a random question id that is not one of the previously
+    played ones, without loading the questions themselves.
+    Keeps an in-memory array of question ids per category and per
+    (category, difficulty) (built lazily from a single
+    `SELECT id, category, difficulty`, or given to fill(), and
+    dropped by invalidate()) and samples it with rejection against
+    a set of the previous ids, so a pick is O(1) expected while the
+    previous questions are a minority of the category. sample()
+    draws several distinct ids the same way (O(n) for n questions),
+    falling back to random.sample over the remaining ids when the
+    request covers a large part of the category.
+    The arrays are built from per-category slices of rows, and
+    invalidate_category() only drops one slice: the next pick
+    reloads that category alone (`WHERE category = ...`) and
+    rebuilds the arrays from memory.
+    With difficulty weights, the difficulty is drawn first from an
+    alias table over the non-empty difficulties of the category
+    (O(1) per draw, the `max_tables` most recently used tables are
+    cached until the index changes), then a question uniformly
+    within it.
+'''
+
+
+def question_category_rows(session, categories=None):
+    query = session.query(Question.id, Question.category,
+                          Question.difficulty)
+    if categories is not None:
+        query = query.filter(Question.in_categories(categories))
+    return query.order_by(Question.id).all()
+
+
+@reads_from_primary
+def load_question_categories(categories=None):
+    return question_category_rows(db.session, categories)
+
+
+'''
+AliasTable(outcomes, weights)
+    Vose's alias method: O(k) to build over k outcomes, then every
+    draw() costs one random index and one biased coin.
+'''
+
+
+class AliasTable:
+
+    def __init__(self, outcomes, weights):
+        if not outcomes:
+            raise ValueError('no outcome to draw')
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError('weights must not all be zero')
+
+        size = len(outcomes)
+        scaled = [weight * size / total for weight in weights]
+        self.outcomes = list(outcomes)
+        self.probability = [1.0] * size
+        self.alias = list(range(size))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+
+    def draw(self, rng=random):
+        i = int(rng.random() * len(self.outcomes))
+        if rng.random() >= self.probability[i]:
+            i = self.alias[i]
+        return self.outcomes[i]
+
+
+'''
+difficulty_weights(difficulties, target, spread)
+    weights of the given difficulties around a target: 1 for the
+    target, spread ** distance for the others (spread 0 keeps the
+    target only).
+'''
+
+
+def difficulty_weights(difficulties, target, spread=DIFFICULTY_SPREAD):
+    if not 0 <= spread <= 1:
+        raise ValueError('difficulty_spread must be between 0 and 1')
+    return {difficulty: spread ** abs(difficulty - target)
+            for difficulty in difficulties
+            if difficulty == target or spread > 0}
+
+
+'''
+quiz_weights(body, picker, category_id)
+    the difficulty weights asked for by a quiz request, or None for
+    a uniform pick:
+        difficulty_weights   explicit {difficulty: weight}
+        difficulty           target difficulty (difficulty_spread)
+        adaptive             the target starts at `difficulty` (the
+                             easiest by default) and goes up by
+                             ADAPTIVE_STEP per correct_answers
+    Raises ValueError on invalid values.
+'''
+
+
+def quiz_weights(body, picker, category_id):
+    weights = body.get('difficulty_weights')
+    if weights is not None:
+        weights = {int(difficulty): float(weight)
+                   for difficulty, weight in weights.items()}
+        if any(weight < 0 for weight in weights.values()):
+            raise ValueError('weights must not be negative')
+        return weights
+
+    target = body.get('difficulty')
+    adaptive = bool(body.get('adaptive', False))
+    if target is None and not adaptive:
+        return None
+
+    difficulties = picker.difficulties(category_id)
+    if not difficulties:
+        return {}
+    target = int(target) if target is not None else difficulties[0]
+    if adaptive:
+        correct_answers = int(body.get('correct_answers', 0))
+        if correct_answers < 0:
+            raise ValueError('correct_answers must not be negative')
+        target = min(target + ADAPTIVE_STEP * correct_answers,
+                     difficulties[-1])
+    spread = float(body.get('difficulty_spread', DIFFICULTY_SPREAD))
+    return difficulty_weights(difficulties, target, spread)
+
+
+class QuestionPicker:
+
+    def __init__(self, max_attempts=MAX_PICK_ATTEMPTS, rng=random,
+                 loader=load_question_categories,
+                 max_tables=MAX_ALIAS_TABLES):
+        self.max_attempts = max_attempts
+        self.max_tables = max_tables
+        self.rng = rng
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._slices = None
+        self._stale = set()
+        self._ids = None
+        self._tables = OrderedDict()
+
+    @staticmethod
+    def _slices_of(rows):
+        slices = {}
+        for question_id, category, difficulty in rows:
+            category = int(category) if category is not None else None
+            slices.setdefault(category, []).append((question_id, difficulty))
+        return slices
+
+    @staticmethod
+    def _index(slices):
+        ids = {None: []}
+        for category, rows in slices.items():
+            for question_id, difficulty in rows:
+                ids[None].append(question_id)
+                ids.setdefault((None, difficulty), []).append(question_id)
+                if category is not None:
+                    ids.setdefault(category, []).append(question_id)
+                    ids.setdefault((category, difficulty), [])\
+                        .append(question_id)
+        return ids
+
+    @property
+    def loaded(self):
+        return self._ids is not None
+
+    def fill(self, rows):
+        with self._lock:
+            self._slices = self._slices_of(rows)
+            self._stale = set()
+            self._ids = self._index(self._slices)
+            self._tables = OrderedDict()
+
+    def _loaded_ids(self):
+        with self._lock:
+            if self._ids is None:
+                if self._slices is None:
+                    self._slices = self._slices_of(self.loader())
+                elif self._stale:
+                    stale = list(self._stale)
+                    for category in stale:
+                        self._slices.pop(category, None)
+                    self._slices.update(self._slices_of(self.loader(stale)))
+                self._stale = set()
+                self._ids = self._index(self._slices)
+                self._tables = OrderedDict()
+            return self._ids
+
+    def ids(self, category_id=None, difficulty=None):
+        key = category_id if difficulty is None else (category_id, difficulty)
+        return self._loaded_ids().get(key, [])
+
+    def difficulties(self, category_id=None):
+        return sorted(key[1] for key in self._loaded_ids()
+                      if isinstance(key, tuple) and key[0] == category_id
+                      and key[1] is not None)
+
+    def invalidate(self):
+        with self._lock:
+            self._slices = None
+            self._ids = None
+            self._tables = OrderedDict()
+
+    def invalidate_category(self, category_id):
+        with self._lock:
+            if self._slices is not None:
+                self._stale.add(category_id)
+            self._ids = None
+            self._tables = OrderedDict()
+
+    def question_changed(self, action, question):
+        if action in ('insert', 'delete') and question is not None:
+            self.invalidate_category(question.category)
+        else:
+            self.invalidate()
+
+    def sample(self, category_id=None, questions_num=None, previous_ids=()):
+        ids = self.ids(category_id)
+        excluded = set(previous_ids)
+        if questions_num is not None and \
+                2 * (questions_num + len(excluded)) <= len(ids):
+            # a few questions of a large category: draw until enough
+            # distinct ones, most draws hit on the first try
+            chosen = {}
+            while len(chosen) < questions_num:
+                candidate = self.rng.choice(ids)
+                if candidate not in excluded:
+                    chosen[candidate] = None
+            return list(chosen)
+
+        if excluded:
+            ids = [i for i in ids if i not in excluded]
+        if questions_num is None or questions_num > len(ids):
+            questions_num = len(ids)
+        return self.rng.sample(ids, questions_num)
+
+    def _table(self, category_id, weights):
+        key = (category_id, tuple(sorted(weights.items())))
+        with self._lock:
+            table = self._tables.get(key)
+            if table is not None:
+                self._tables.move_to_end(key)
+        if table is None:
+            outcomes = [difficulty for difficulty, weight
+                        in sorted(weights.items())
+                        if weight > 0 and self.ids(category_id, difficulty)]
+            if not outcomes:
+                return None
+            table = AliasTable(outcomes, [weights[d] for d in outcomes])
+            with self._lock:
+                self._tables[key] = table
+                if len(self._tables) > self.max_tables:
+                    self._tables.popitem(last=False)
+        return table
+
+    def pick(self, category_id=None, previous_ids=(), weights=None):
+        if weights is not None:
+            return self._pick_weighted(category_id, previous_ids, weights)
+
+        ids = self.ids(category_id)
+        excluded = set(previous_ids)
+        if not ids:
+            return None
+
+        if len(excluded) < len(ids):
+            for _ in range(self.max_attempts):
+                candidate = self.rng.choice(ids)
+                if candidate not in excluded:
+                    return candidate
+
+        remaining = [i for i in ids if i not in excluded]
+        if not remaining:
+            return None
+        return self.rng.choice(remaining)
+
+    def _pick_weighted(self, category_id, previous_ids, weights):
+        table = self._table(category_id, weights)
+        if table is None:
+            return None
+        index = self._loaded_ids()
+        excluded = set(previous_ids)
+
+        for _ in range(self.max_attempts):
+            candidate = self.rng.choice(
+                index[(category_id, table.draw(self.rng))])
+            if candidate not in excluded:
+                return candidate
+
+        # most of the likely questions were played, draw among
+        # the difficulties that still have some
+        remaining = {}
+        for difficulty in table.outcomes:
+            ids = [i for i in index[(category_id, difficulty)]
+                   if i not in excluded]
+            if ids:
+                remaining[difficulty] = ids
+        if not remaining:
+            return None
+        difficulty = AliasTable(
+            list(remaining), [weights[d] for d in remaining]).draw(self.rng)
+        return self.rng.choice(remaining[difficulty])
+
+
+'''
+pick_question(picker, fetch_question, reload, category_id,
+              previous_ids, weights)
+    the question picked for a quiz, fetched by id with
+    fetch_question. When it is gone (deleted by another process
+    since the picker was built), reload() refreshes the picker and
+    one more question is picked. Shared by both apps.
+'''
+
+
+def pick_question(picker, fetch_question, reload, category_id,
+                  previous_ids, weights=None):
+    previous_ids = list(previous_ids or ())
+    question_id = picker.pick(category_id, previous_ids, weights)
+    if question_id is None:
+        return None
+
+    question = fetch_question(question_id)
+    if question is None:
+        # the index is stale, the question was deleted elsewhere
+        reload()
+        question_id = picker.pick(category_id, previous_ids + [question_id],
+                                  weights)
+        if question_id is None:
+            return None
+        question = fetch_question(question_id)
+    return question
+
+
+'''
+sample_questions(picker, fetch_questions, reload, category_id,
+                 questions_num, previous_ids)
+    the questions of a quiz round, like pick_question.
+'''
+
+
+def sample_questions(picker, fetch_questions, reload, category_id,
+                     questions_num, previous_ids):
+    previous_ids = list(previous_ids or ())
+    question_ids = picker.sample(category_id, questions_num, previous_ids)
+    questions = fetch_questions(question_ids)
+    if len(questions) < len(question_ids):
+        # the index is stale, some were deleted elsewhere
+        reload()
+        question_ids = picker.sample(category_id, questions_num,
+                                     previous_ids)
+        questions = fetch_questions(question_ids)
+    return questions
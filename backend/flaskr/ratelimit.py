@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models import DB_MAX_OVERFLOW, DB_NULL_POOL, DB_POOL_SIZE
+
+# requests per second and burst of every client on every route,
+# a rate of 0 disables the default budget
+RATE_LIMIT = float(os.getenv('RATE_LIMIT', 0))
+RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', 20))
+# per-route budgets, e.g. "quizzes=2/5,search_questions=5/10"
+RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+# requests served at once by a process, past which requests are
+# shed instead of waiting for a database connection
+MAX_CONCURRENT_REQUESTS = int(os.getenv(
+    'MAX_CONCURRENT_REQUESTS',
+    0 if DB_NULL_POOL else DB_POOL_SIZE + DB_MAX_OVERFLOW))
+MAX_BUCKETS = 100000
+
+
+'''
+parse_rate_limits(spec)
+    {endpoint: (rate, burst)} from "endpoint=rate/burst,...".
+    The burst defaults to RATE_LIMIT_BURST.
+    Raises ValueError on a malformed budget.
+'''
+
+
+def parse_rate_limits(spec):
+    limits = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        endpoint, _, budget = item.partition('=')
+        rate, _, burst = budget.partition('/')
+        rate = float(rate)
+        burst = int(burst) if burst.strip() else RATE_LIMIT_BURST
+        if not endpoint.strip() or rate <= 0 or burst < 1:
+            raise ValueError('invalid rate limit: {!r}'.format(item))
+        limits[endpoint.strip()] = (rate, burst)
+    return limits
+
+
+'''
+RateLimitStore
+    interface of the token bucket storage.
+    take(key, rate, burst) refills the bucket of `key` by `rate`
+    tokens a second up to `burst`, then takes one token. It returns
+    0 when the request is allowed, else the seconds until a token is
+    available. A shared backend (e.g. a Redis script updating a hash
+    of tokens and timestamp) can implement it atomically and be
+    passed to create_app, so the budgets hold across processes.
+'''
+
+
+class RateLimitStore:
+
+    def take(self, key, rate, burst):
+        raise NotImplementedError
+
+
+'''
+MemoryRateLimitStore
+    in-process token buckets as (tokens, last refill) pairs,
+    keeping the `max_size` most recently used ones. A bucket that
+    was evicted starts over full, like one refilled while idle.
+'''
+
+
+class MemoryRateLimitStore(RateLimitStore):
+
+    def __init__(self, max_size=MAX_BUCKETS, clock=time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+
+    def take(self, key, rate, burst):
+        now = self.clock()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+'''
+RateLimiter
+    per-client budgets: a request takes a token from the bucket of
+    its client for its endpoint when the endpoint has a budget of
+    its own, else from the client's bucket shared by the other
+    endpoints (when a default rate is set).
+    check(endpoint, client) returns the seconds to wait, 0 when the
+    request is allowed.
+'''
+
+
+class RateLimiter:
+
+    def __init__(self, store=None, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST,
+                 routes=None):
+        self.store = store or MemoryRateLimitStore()
+        self.default = (rate, burst) if rate > 0 else None
+        self.routes = parse_rate_limits(RATE_LIMITS) if routes is None \
+            else routes
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return self.default is not None or bool(self.routes)
+
+    def check(self, endpoint, client):
+        budget = self.routes.get(endpoint)
+        if budget is not None:
+            key = '{}:{}'.format(endpoint, client)
+        elif self.default is not None:
+            budget, key = self.default, '*:{}'.format(client)
+        else:
+            return 0
+        wait = self.store.take(key, *budget)
+        if wait:
+            self.limited += 1
+        return wait
+
+
+'''
+ConcurrencyLimit
+    counts the requests in flight, enter() refuses one past
+    `max_requests` (0 disables the cap) and leave() frees its slot.
+'''
+
+
+class ConcurrencyLimit:
+
+    def __init__(self, max_requests=MAX_CONCURRENT_REQUESTS):
+        self.max_requests = max_requests
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.shed = 0
+
+    def enter(self):
+        with self._lock:
+            if self.max_requests and self.in_flight >= self.max_requests:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+'''
+retry_after_headers(error)
+    the Retry-After header of a 429 or 503 error, if it has one.
+'''
+
+
+def retry_after_headers(error):
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is None:
+        return {}
+    return {'Retry-After': str(retry_after)}
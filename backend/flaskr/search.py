@@ -0,0 +1,193 @@
+import threading
+
+from sqlalchemy import func, or_
+
+from models import db, reads_from_primary, Question
+
+
+'''
+trigrams(text)
+    set of the 3-character substrings of the lower-cased text.
+    Every substring of 3 characters or more of a text shares all
+    of its trigrams with it, which lets the index answer the same
+    '%term%' queries as ILIKE.
+'''
+
+
+def trigrams(text):
+    text = (text or '').lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def similarity(term_trigrams, text_trigrams):
+    if not term_trigrams or not text_trigrams:
+        return 0.0
+    shared = len(term_trigrams & text_trigrams)
+    return shared / float(len(term_trigrams | text_trigrams))
+
+
+'''
+search_filter(term, include_answers)
+    the case-insensitive substring condition of a search, served by
+    the trigram GIN indexes on Postgres.
+'''
+
+
+def search_filter(term, include_answers=False):
+    pattern = '%' + term + '%'
+    if include_answers:
+        return or_(Question.question.ilike(pattern),
+                   Question.answer.ilike(pattern))
+    return Question.question.ilike(pattern)
+
+
+'''
+search_rank(term, include_answers)
+    ORDER BY clause ranking results by pg_trgm similarity,
+    most similar first.
+'''
+
+
+def search_rank(term, include_answers=False):
+    rank = func.similarity(Question.question, term)
+    if include_answers:
+        rank = func.greatest(rank, func.similarity(Question.answer, term))
+    return rank.desc()
+
+
+'''
+TrigramIndex
+    in-process inverted index of question and answer trigrams,
+    used instead of the database when it has no trigram support
+    (e.g. SQLite test runs).
+    Candidates are the intersection of the posting sets of the
+    term's trigrams, checked against the text and ranked by
+    trigram similarity like pg_trgm does.
+    Loaded lazily (or given to fill()) and kept up to date as a
+    question listener. invalidate_category() marks the questions of
+    a category as changed elsewhere, they are reloaded alone by the
+    next search.
+'''
+
+
+@reads_from_primary
+def load_question_texts(categories=None):
+    query = db.session.query(Question.id, Question.question,
+                             Question.answer, Question.category)
+    if categories is not None:
+        query = query.filter(Question.in_categories(categories))
+    return query.all()
+
+
+class TrigramIndex:
+
+    def __init__(self, loader=load_question_texts):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._texts = None
+        self._postings = None
+        self._categories = None
+        self._stale = set()
+
+    def _fill(self, rows):
+        self._texts = {}
+        self._postings = {'question': {}, 'answer': {}}
+        self._categories = {}
+        self._stale = set()
+        for row in rows:
+            self._add(*row)
+
+    def _reload_stale(self):
+        stale = list(self._stale)
+        self._stale = set()
+        for question_id, category in list(self._categories.items()):
+            if category in stale:
+                self._remove(question_id)
+        for row in self.loader(stale):
+            self._add(*row)
+
+    @property
+    def loaded(self):
+        return self._texts is not None and not self._stale
+
+    def fill(self, rows):
+        with self._lock:
+            self._fill(rows)
+
+    def _add(self, question_id, question, answer, category):
+        self._texts[question_id] = ((question or '').lower(),
+                                    (answer or '').lower())
+        self._categories[question_id] = category
+        for field, value in (('question', question), ('answer', answer)):
+            postings = self._postings[field]
+            for gram in trigrams(value):
+                postings.setdefault(gram, set()).add(question_id)
+
+    def _remove(self, question_id):
+        texts = self._texts.pop(question_id, None)
+        if texts is None:
+            return
+        del self._categories[question_id]
+        for field, value in zip(('question', 'answer'), texts):
+            postings = self._postings[field]
+            for gram in trigrams(value):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(question_id)
+                    if not ids:
+                        del postings[gram]
+
+    def _candidates(self, field, term, term_trigrams):
+        if not term_trigrams:
+            # shorter than a trigram, check every text
+            return set(self._texts)
+        postings = self._postings[field]
+        sets = sorted((postings.get(gram, set()) for gram in term_trigrams),
+                      key=len)
+        return set(sets[0]).intersection(*sets[1:])
+
+    def search(self, term, include_answers=False):
+        term = term.lower()
+        term_trigrams = trigrams(term)
+        fields = (0, 1) if include_answers else (0,)
+        with self._lock:
+            if self._texts is None:
+                self._fill(self.loader())
+            elif self._stale:
+                self._reload_stale()
+            candidates = self._candidates('question', term, term_trigrams)
+            if include_answers:
+                candidates |= self._candidates('answer', term, term_trigrams)
+
+            ranked = []
+            for question_id in candidates:
+                texts = self._texts[question_id]
+                matches = [texts[field] for field in fields
+                           if term in texts[field]]
+                if matches:
+                    rank = max(similarity(term_trigrams, trigrams(match))
+                               for match in matches)
+                    ranked.append((-rank, question_id))
+        ranked.sort()
+        return [question_id for _, question_id in ranked]
+
+    def question_changed(self, action, question):
+        with self._lock:
+            if self._texts is None:
+                return
+            if question is None:
+                self._texts = None
+                return
+            self._remove(question.id)
+            if action != 'delete':
+                self._add(question.id, question.question, question.answer,
+                          question.category)
+
+    def invalidate_category(self, category_id):
+        with self._lock:
+            if self._texts is not None:
+                self._stale.add(category_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._texts = None
@@ -0,0 +1,76 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+from models import db, Question, Category
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library is used instead
+    orjson = None
+
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer,
+                    Question.category, Question.difficulty)
+QUESTION_FIELDS = tuple(column.key for column in QUESTION_COLUMNS)
+CATEGORY_COLUMNS = (Category.id, Category.type)
+CATEGORY_FIELDS = tuple(column.key for column in CATEGORY_COLUMNS)
+
+
+'''
+Serialization
+    listings select only the columns they return, as row tuples,
+    and turn them into the dicts Question.format() would give
+    without building ORM instances (row_dicts, fetch_questions
+    keeps the order of the ids it's given, in db.session or the
+    given session, e.g. the sync session of the async app).
+    Bodies are encoded by orjson when it is installed, by the
+    standard library otherwise (dumps). orjson writes non-ASCII
+    characters as UTF-8 instead of \\u escapes.
+'''
+
+
+def row_dicts(rows, fields=QUESTION_FIELDS):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def fetch_questions(question_ids, session=db.session):
+    rows = session.query(*QUESTION_COLUMNS)\
+        .filter(Question.id.in_(question_ids)).all()
+    by_id = {row[0]: row for row in rows}
+    return row_dicts(by_id[question_id] for question_id in question_ids
+                     if question_id in by_id)
+
+
+def fetch_question(question_id, session=db.session):
+    questions = fetch_questions([question_id], session)
+    return questions[0] if questions else None
+
+
+def dumps(obj, default=None, sort_keys=False):
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default, option=option)
+    return json.dumps(obj, default=default, sort_keys=sort_keys,
+                      separators=(',', ':')).encode()
+
+
+'''
+FastJSONMixin
+    makes a Flask or Quart JSON provider encode compact bodies with
+    dumps(), so jsonify() takes the fast path. Pretty printed
+    (debug) bodies still go through the standard library.
+'''
+
+
+class FastJSONMixin:
+
+    def dumps(self, obj, **kwargs):
+        if kwargs and kwargs != {'separators': (',', ':')}:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj, self.default, self.sort_keys).decode()
+
+
+class FastJSONProvider(FastJSONMixin, DefaultJSONProvider):
+    pass
@@ -0,0 +1,82 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+SESSION_TTL = 60 * 60
+MAX_SESSIONS = 10000
+
+
+'''
+SessionStore
+    interface of the quiz session storage.
+    A session state is a plain JSON-serializable dict, so a shared
+    backend (e.g. Redis with SETEX/GET/DEL) can implement these
+    three methods and be passed to create_app instead of the
+    in-process store.
+'''
+
+
+class SessionStore:
+
+    def get(self, session_id):
+        raise NotImplementedError
+
+    def set(self, session_id, state):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def new_id(self):
+        return secrets.token_urlsafe(16)
+
+
+'''
+MemorySessionStore
+    in-process LRU of sessions, each expiring `ttl` seconds after
+    its last write.
+'''
+
+
+class MemorySessionStore(SessionStore):
+
+    def __init__(self, ttl=SESSION_TTL, max_size=MAX_SESSIONS,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def set(self, session_id, state):
+        with self._lock:
+            self._sessions[session_id] = (state, self.clock() + self.ttl)
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    def _evict(self):
+        now = self.clock()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest[1] > now and len(self._sessions) <= self.max_size:
+                break
+            self._sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
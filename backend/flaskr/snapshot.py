@@ -0,0 +1,160 @@
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from models import db, Question, Category
+from .pagination import QUESTIONS_PER_PAGE, page_window
+from .serialization import (QUESTION_COLUMNS, QUESTION_FIELDS,
+                            CATEGORY_COLUMNS)
+
+# serve the question bank from an in-memory snapshot, read-only
+READ_ONLY = os.getenv('READ_ONLY_SNAPSHOT', '0') == '1'
+
+
+'''
+SnapshotColumns(question_rows, category_rows)
+    the questions as parallel arrays ordered by id: ids, categories
+    and difficulties in typed arrays (0 stands for NULL), texts in
+    lists with interned answers, plus per-category arrays of ids and
+    row numbers. Category types are interned.
+    Immutable once built, a reload builds a new one.
+'''
+
+
+class SnapshotColumns:
+    __slots__ = ('ids', 'texts', 'answers', 'categories', 'difficulties',
+                 'category_ids', 'category_rows', 'category_types')
+
+    def __init__(self, question_rows, category_rows):
+        self.ids = array('q')
+        self.texts = []
+        self.answers = []
+        self.categories = array('q')
+        # the difficulty column is a 32-bit INTEGER
+        self.difficulties = array('i')
+        self.category_ids = {}
+        self.category_rows = {}
+        for row_number, (question_id, question, answer, category,
+                         difficulty) in enumerate(question_rows):
+            self.ids.append(question_id)
+            self.texts.append(question)
+            self.answers.append(sys.intern(answer) if answer else answer)
+            self.categories.append(category or 0)
+            self.difficulties.append(difficulty or 0)
+            if category is not None:
+                self.category_ids.setdefault(category, array('q'))\
+                    .append(question_id)
+                self.category_rows.setdefault(category, array('q'))\
+                    .append(row_number)
+        self.category_types = tuple((category_id, sys.intern(category_type))
+                                    for category_id, category_type
+                                    in category_rows)
+
+    def row(self, i):
+        return dict(zip(QUESTION_FIELDS, (
+            self.ids[i], self.texts[i], self.answers[i],
+            self.categories[i] or None, self.difficulties[i] or None)))
+
+
+'''
+QuestionSnapshot
+    read-only copy of the questions and categories tables for
+    create_app(read_only=True), loaded with two queries by load()
+    and swapped as a whole, so requests never see half a reload.
+    Answers pages, counts and lookups by id from memory, and feeds
+    the quiz picker, the search and suggestion indexes (as their
+    loader) and the category cache.
+'''
+
+
+class QuestionSnapshot:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = None
+
+    def load(self):
+        question_rows = db.session.query(*QUESTION_COLUMNS)\
+            .order_by(Question.id).all()
+        category_rows = db.session.query(*CATEGORY_COLUMNS)\
+            .order_by(Category.id).all()
+        columns = SnapshotColumns(question_rows, category_rows)
+        with self._lock:
+            self._columns = columns
+        return len(columns.ids)
+
+    @property
+    def loaded(self):
+        return self._columns is not None
+
+    def _rows_of(self, columns, categories=None):
+        if categories is None:
+            return range(len(columns.ids))
+        rows = []
+        for category in categories:
+            if category is None:
+                rows.extend(i for i in range(len(columns.ids))
+                            if not columns.categories[i])
+            else:
+                rows.extend(columns.category_rows.get(category, ()))
+        return sorted(rows)
+
+    def count(self, category_id=None):
+        columns = self._columns
+        if category_id is None:
+            return len(columns.ids)
+        return len(columns.category_ids.get(category_id, ()))
+
+    def categories(self):
+        return [{'id': category_id, 'type': category_type}
+                for category_id, category_type
+                in self._columns.category_types]
+
+    def question(self, question_id):
+        columns = self._columns
+        i = bisect_left(columns.ids, question_id)
+        if i < len(columns.ids) and columns.ids[i] == question_id:
+            return columns.row(i)
+        return None
+
+    def questions(self, question_ids):
+        questions = (self.question(question_id)
+                     for question_id in question_ids)
+        return [question for question in questions if question is not None]
+
+    def paginate(self, args, category_id=None, per_page=QUESTIONS_PER_PAGE):
+        columns = self._columns
+        if category_id is None:
+            ids, rows = columns.ids, None
+        else:
+            ids = columns.category_ids.get(category_id, array('q'))
+            rows = columns.category_rows.get(category_id, array('q'))
+
+        after_id, offset = page_window(args, True, per_page)
+        if after_id is not None:
+            offset = bisect_right(ids, after_id)
+        elif offset is None:
+            return []
+        page = range(offset, min(offset + per_page, len(ids)))
+        return [columns.row(rows[i] if rows is not None else i)
+                for i in page]
+
+    def picker_rows(self, categories=None):
+        columns = self._columns
+        return [(columns.ids[i], columns.categories[i] or None,
+                 columns.difficulties[i] or None)
+                for i in self._rows_of(columns, categories)]
+
+    def text_rows(self, categories=None):
+        columns = self._columns
+        return [(columns.ids[i], columns.texts[i], columns.answers[i],
+                 columns.categories[i] or None)
+                for i in self._rows_of(columns, categories)]
+
+    def title_rows(self, categories=None):
+        columns = self._columns
+        return [(columns.ids[i], columns.texts[i],
+                 columns.categories[i] or None)
+                for i in self._rows_of(columns, categories)]
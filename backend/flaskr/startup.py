@@ -0,0 +1,45 @@
+import logging
+import os
+import time
+
+# log the time spent in each phase of create_app()
+STARTUP_PROFILE = os.getenv('STARTUP_PROFILE', '0') == '1'
+
+logger = logging.getLogger(__name__)
+
+
+'''
+StartupProfile
+    wall time of the phases of create_app(): mark(phase) closes the
+    phase that ran since the previous mark. Kept on every app as
+    app.extensions['startup_profile'], report() formats it.
+'''
+
+
+class StartupProfile:
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.phases = []
+        self._last = clock()
+
+    def mark(self, phase):
+        now = self.clock()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def as_dict(self):
+        return {phase: seconds * 1000 for phase, seconds in self.phases}
+
+    def report(self):
+        lines = ['%-16s %9.2f ms' % (phase, seconds * 1000)
+                 for phase, seconds in self.phases]
+        lines.append('%-16s %9.2f ms' % ('total', self.total * 1000))
+        return '\n'.join(lines)
+
+    def log(self):
+        logger.warning('create_app startup:\n%s', self.report())
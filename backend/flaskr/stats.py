@@ -0,0 +1,105 @@
+import threading
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, Question, QuestionStat, rebuild_question_stats
+
+'''
+QuestionStats
+    question counts read from the denormalized question_stats table
+    (see models), a few rows per category, so no listing ever needs
+    a COUNT(*) over the questions.
+    check() runs before the first request, once per database in the
+    process (apps created later skip it): an empty question_stats
+    next to a non-empty questions table (a database restored from
+    trivia.psql, or created before the table existed) is rebuilt
+    with a single GROUP BY.
+'''
+
+# databases of the process whose question_stats were checked
+_checked_databases = set()
+
+
+def total_statement(category_id=None):
+    statement = select(func.coalesce(func.sum(QuestionStat.count), 0))
+    if category_id is not None:
+        statement = statement.where(QuestionStat.category == category_id)
+    return statement
+
+
+def histogram_statement():
+    return select(QuestionStat.category, QuestionStat.difficulty,
+                  QuestionStat.count)\
+        .where(QuestionStat.count > 0)\
+        .order_by(QuestionStat.category, QuestionStat.difficulty)
+
+
+def needs_rebuild_statements():
+    return (select(QuestionStat.category).limit(1),
+            select(Question.id).limit(1))
+
+
+'''
+stats_summary(rows, categories)
+    the GET /stats body from the (category, difficulty, count) rows
+    and the formatted categories: totals overall, per difficulty
+    and per category, every category listed even when empty.
+'''
+
+
+def stats_summary(rows, categories):
+    by_category = {}
+    difficulties = {}
+    total = 0
+    for category, difficulty, count in rows:
+        by_category.setdefault(category, {})[difficulty] = count
+        difficulties[difficulty] = difficulties.get(difficulty, 0) + count
+        total += count
+
+    return {
+        'total_questions': total,
+        'difficulties': difficulties,
+        'categories': [{
+            'id': category['id'],
+            'type': category['type'],
+            'total_questions': sum(
+                by_category.get(category['id'], {}).values()),
+            'difficulties': by_category.get(category['id'], {}),
+        } for category in categories],
+    }
+
+
+class QuestionStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = False
+
+    def check(self):
+        if self._checked:
+            return
+        with self._lock:
+            if self._checked:
+                return
+            database = str(db.engine.url)
+            if database in _checked_databases:
+                self._checked = True
+                return
+            try:
+                any_stat, any_question = needs_rebuild_statements()
+                if db.session.execute(any_stat).first() is None and \
+                        db.session.execute(any_question).first() is not None:
+                    rebuild_question_stats(db.session)
+                db.session.commit()
+                _checked_databases.add(database)
+                self._checked = True
+            except SQLAlchemyError:
+                # no schema yet, checked again on the next request
+                db.session.rollback()
+
+    def total(self, category_id=None):
+        return db.session.execute(total_statement(category_id)).scalar()
+
+    def histogram(self):
+        return db.session.execute(histogram_statement()).all()
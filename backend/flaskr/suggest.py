@@ -0,0 +1,196 @@
+import bisect
+import re
+import threading
+
+from models import db, reads_from_primary, Question
+
+SUGGESTIONS = 5
+MAX_SUGGESTIONS = 20
+MAX_PREFIX_LENGTH = 64
+# postings looked at by a suggestion, bounds the cost of prefixes
+# whose earlier words rule out most of the candidates
+MAX_SUGGEST_SCAN = 1000
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+'''
+words(text)
+    the lower-cased words of a text, in order.
+'''
+
+
+def words(text):
+    return _WORD.findall((text or '').lower())
+
+
+'''
+PrefixIndex
+    in-process index of the words of the question texts for
+    search-as-you-type: a sorted array of the distinct words, each
+    with the sorted ids of the questions containing it.
+    suggest(prefix) bisects to the first word starting with the
+    last word of the prefix and walks the following words and their
+    ids until `limit` questions were found, O(log words + limit)
+    when the prefix is a single word. The other words of the prefix
+    must appear in a suggested question. Suggestions are ordered by
+    the matching word, then by id, so the exact word comes first.
+    Memory is one entry per distinct word plus one id per
+    (word, question) pair and the question texts.
+    Loaded at startup (or lazily, or given to fill()) and kept up
+    to date as a question listener, like TrigramIndex.
+'''
+
+
+@reads_from_primary
+def load_question_titles(categories=None):
+    query = db.session.query(Question.id, Question.question,
+                             Question.category)
+    if categories is not None:
+        query = query.filter(Question.in_categories(categories))
+    return query.order_by(Question.id).all()
+
+
+class PrefixIndex:
+
+    def __init__(self, loader=load_question_titles):
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._texts = None
+        self._words = None
+        self._categories = None
+        self._postings = None
+        self._sorted_words = None
+        self._stale = set()
+
+    def _fill(self, rows):
+        self._texts = {}
+        self._words = {}
+        self._categories = {}
+        self._postings = {}
+        self._sorted_words = []
+        self._stale = set()
+        self._add_rows(rows)
+
+    def _reload_stale(self):
+        stale = list(self._stale)
+        self._stale = set()
+        for question_id, category in list(self._categories.items()):
+            if category in stale:
+                self._remove(question_id)
+        self._add_rows(self.loader(stale))
+
+    def _loaded(self):
+        if self._texts is None:
+            self._fill(self.loader())
+        elif self._stale:
+            self._reload_stale()
+
+    @property
+    def loaded(self):
+        return self._texts is not None and not self._stale
+
+    def fill(self, rows):
+        with self._lock:
+            self._fill(rows)
+
+    def load(self):
+        with self._lock:
+            self._loaded()
+
+    def _add(self, question_id, question, category):
+        question_words = frozenset(words(question))
+        self._texts[question_id] = question
+        self._words[question_id] = question_words
+        self._categories[question_id] = category
+        for word in question_words:
+            ids = self._postings.get(word)
+            if ids is None:
+                ids = self._postings[word] = []
+                bisect.insort(self._sorted_words, word)
+            bisect.insort(ids, question_id)
+
+    def _add_rows(self, rows):
+        # append the postings, then sort each touched list once
+        # instead of an insort per posting (quadratic on large banks)
+        touched = set()
+        words_num = len(self._postings)
+        for question_id, question, category in rows:
+            question_words = frozenset(words(question))
+            self._texts[question_id] = question
+            self._words[question_id] = question_words
+            self._categories[question_id] = category
+            for word in question_words:
+                self._postings.setdefault(word, []).append(question_id)
+            touched.update(question_words)
+        for word in touched:
+            self._postings[word].sort()
+        if len(self._postings) != words_num:
+            self._sorted_words = sorted(self._postings)
+
+    def _remove(self, question_id):
+        question_words = self._words.pop(question_id, None)
+        if question_words is None:
+            return
+        del self._texts[question_id]
+        del self._categories[question_id]
+        for word in question_words:
+            ids = self._postings[word]
+            del ids[bisect.bisect_left(ids, question_id)]
+            if not ids:
+                del self._postings[word]
+                del self._sorted_words[
+                    bisect.bisect_left(self._sorted_words, word)]
+
+    def suggest(self, prefix, limit=SUGGESTIONS):
+        prefix_words = words(prefix[:MAX_PREFIX_LENGTH])
+        if not prefix_words:
+            return []
+        last = prefix_words[-1]
+        required = frozenset(prefix_words[:-1])
+
+        suggestions = []
+        seen = set()
+        scanned = 0
+        with self._lock:
+            self._loaded()
+            sorted_words = self._sorted_words
+            i = bisect.bisect_left(sorted_words, last)
+            while i < len(sorted_words) and \
+                    sorted_words[i].startswith(last):
+                for question_id in self._postings[sorted_words[i]]:
+                    scanned += 1
+                    if scanned > MAX_SUGGEST_SCAN:
+                        return suggestions
+                    if question_id in seen or \
+                            not required <= self._words[question_id]:
+                        continue
+                    seen.add(question_id)
+                    suggestions.append({
+                        'id': question_id,
+                        'question': self._texts[question_id],
+                    })
+                    if len(suggestions) == limit:
+                        return suggestions
+                i += 1
+        return suggestions
+
+    def question_changed(self, action, question):
+        with self._lock:
+            if self._texts is None:
+                return
+            if question is None:
+                self._texts = None
+                return
+            self._remove(question.id)
+            if action != 'delete':
+                self._add(question.id, question.question, question.category)
+
+    def invalidate_category(self, category_id):
+        with self._lock:
+            if self._texts is not None:
+                self._stale.add(category_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._texts = None
@@ -0,0 +1,207 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import Integer, inspect, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import SEARCH_INDEXES_DDL, rebuild_question_stats
+
+BACKFILL_BATCH_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+'''
+Schema migrations
+    ordered, idempotent steps bringing a database created from
+    trivia.psql (or by an older create_all) up to the current
+    models. Applied versions are recorded in schema_migrations,
+    and every step also checks the schema itself, so running the
+    migrations again is always safe.
+    Run them with `flask migrate`.
+'''
+
+MIGRATIONS = []
+
+
+class MigrationError(Exception):
+    pass
+
+
+def migration(version):
+    def register(step):
+        MIGRATIONS.append((version, step))
+        return step
+    return register
+
+
+def _columns(engine, table):
+    return {column['name']: column
+            for column in inspect(engine).get_columns(table)}
+
+
+'''
+backfill(engine, statement, batch_size)
+    runs an UPDATE over the questions table one id range at a time,
+    each range in its own transaction, so large tables are never
+    locked for the whole backfill.
+    The statement gets the range as :low (exclusive) and :high.
+'''
+
+
+def backfill(engine, statement, batch_size=BACKFILL_BATCH_SIZE):
+    with engine.connect() as connection:
+        low, high = connection.execute(
+            text('SELECT MIN(id), MAX(id) FROM questions')).one()
+    if low is None:
+        return
+
+    low -= 1
+    while low < high:
+        with engine.begin() as connection:
+            connection.execute(text(statement),
+                               {'low': low, 'high': low + batch_size})
+        low += batch_size
+
+
+@migration('0001_question_category_integer')
+def question_category_integer(engine, batch_size):
+    columns = _columns(engine, 'questions')
+    if isinstance(columns['category']['type'], Integer):
+        return
+
+    if 'category_id' not in columns:
+        with engine.begin() as connection:
+            connection.execute(text(
+                'ALTER TABLE questions ADD COLUMN category_id INTEGER'))
+
+    backfill(engine,
+             'UPDATE questions SET category_id = CAST(category AS INTEGER) '
+             'WHERE id > :low AND id <= :high',
+             batch_size)
+
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE questions DROP COLUMN category'))
+        connection.execute(text(
+            'ALTER TABLE questions RENAME COLUMN category_id TO category'))
+
+
+@migration('0002_question_category_foreign_key')
+def question_category_foreign_key(engine, batch_size):
+    # SQLite can't add a constraint to an existing table
+    if engine.dialect.name != 'postgresql':
+        return
+    foreign_keys = inspect(engine).get_foreign_keys('questions')
+    if any(key['referred_table'] == 'categories' for key in foreign_keys):
+        return
+
+    with engine.begin() as connection:
+        orphans = connection.execute(text(
+            'SELECT COUNT(*) FROM questions WHERE category IS NOT NULL '
+            'AND category NOT IN (SELECT id FROM categories)')).scalar()
+        if orphans:
+            raise MigrationError('{} questions reference missing categories'
+                                 .format(orphans))
+        # NOT VALID then VALIDATE avoids blocking writes while the
+        # existing rows are checked
+        connection.execute(text(
+            'ALTER TABLE questions ADD CONSTRAINT fk_questions_category '
+            'FOREIGN KEY (category) REFERENCES categories (id) NOT VALID'))
+    with engine.begin() as connection:
+        connection.execute(text(
+            'ALTER TABLE questions VALIDATE CONSTRAINT fk_questions_category'))
+
+
+@migration('0003_question_filter_indexes')
+def question_filter_indexes(engine, batch_size):
+    statements = [
+        'CREATE INDEX {}IF NOT EXISTS ix_questions_category_id '
+        'ON questions (category, id)',
+        'CREATE INDEX {}IF NOT EXISTS ix_questions_category_difficulty '
+        'ON questions (category, difficulty)',
+    ]
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement.format('')))
+        return
+
+    # CONCURRENTLY keeps the table writable while the index is built,
+    # but can't run inside a transaction
+    with engine.connect() as connection:
+        connection = connection.execution_options(
+            isolation_level='AUTOCOMMIT')
+        for statement in statements:
+            connection.execute(text(statement.format('CONCURRENTLY ')))
+
+
+@migration('0004_question_stats')
+def question_stats(engine, batch_size):
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS question_stats ('
+            'category INTEGER NOT NULL, difficulty INTEGER NOT NULL, '
+            'count INTEGER NOT NULL DEFAULT 0, '
+            'PRIMARY KEY (category, difficulty))'))
+        # a single GROUP BY, the table has a row per pair only
+        rebuild_question_stats(connection)
+
+
+@migration('0005_search_indexes')
+def search_indexes(engine, batch_size):
+    # the trigram indexes of create_search_indexes(), for databases
+    # restored from trivia.psql instead of created by init-db
+    if engine.dialect.name != 'postgresql':
+        return
+    extension = [statement for statement in SEARCH_INDEXES_DDL
+                 if statement.startswith('CREATE EXTENSION')]
+    indexes = [statement for statement in SEARCH_INDEXES_DDL
+               if statement.startswith('CREATE INDEX ')]
+    try:
+        with engine.begin() as connection:
+            for statement in extension:
+                connection.execute(text(statement))
+    except SQLAlchemyError:
+        logger.warning('could not create the pg_trgm extension, '
+                       'searches will use the in-process index')
+        return
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(
+            isolation_level='AUTOCOMMIT')
+        for statement in indexes:
+            connection.execute(text(statement.replace(
+                'CREATE INDEX ', 'CREATE INDEX CONCURRENTLY ', 1)))
+
+
+def applied_migrations(engine):
+    with engine.begin() as connection:
+        connection.execute(text(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP)'))
+        rows = connection.execute(text(
+            'SELECT version FROM schema_migrations'))
+        return {row[0] for row in rows}
+
+
+'''
+run_migrations(engine, batch_size)
+    applies every migration not recorded yet, in order, and
+    returns the versions it applied.
+'''
+
+
+def run_migrations(engine, batch_size=BACKFILL_BATCH_SIZE):
+    applied = applied_migrations(engine)
+    newly_applied = []
+    for version, step in MIGRATIONS:
+        if version in applied:
+            continue
+        logger.info('applying migration %s', version)
+        step(engine, batch_size)
+        with engine.begin() as connection:
+            connection.execute(text(
+                'INSERT INTO schema_migrations (version, applied_at) '
+                'VALUES (:version, :applied_at)'),
+                {'version': version, 'applied_at': datetime.utcnow()})
+        newly_applied.append(version)
+    return newly_applied
@@ -1,29 +1,518 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import functools
+import itertools
+import logging
+import threading
+import time
+import weakref
+from collections import Counter
+from sqlalchemy import (Column, String, Integer, ForeignKey, Index,
+                        and_, create_engine, event, inspect, or_, orm, select,
+                        text)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.dml import UpdateBase
+from flask import current_app, has_app_context
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
 import json
 
 DB_HOST = os.getenv('DB_HOST', '127.0.0.1:5432')
 DB_USER = os.getenv('DB_USER', 'Raymond')
 DB_PASSWORD = os.getenv('DB_PASSWORD', '0000')
 DB_NAME = os.getenv('DB_NAME', 'trivia')
-DB_PATH = 'postgresql+psycopg2://{}:{}@{}/{}'\
-    .format(DB_USER, DB_PASSWORD, DB_HOST, DB_NAME)
+DB_PATH = os.getenv('DATABASE_URL', 'postgresql+psycopg2://{}:{}@{}/{}'
+                    .format(DB_USER, DB_PASSWORD, DB_HOST, DB_NAME))
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+# milliseconds, 0 disables the timeout
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+# let an external pooler (e.g. PgBouncer) own the connections
+DB_NULL_POOL = os.getenv('DB_NULL_POOL', '0') == '1'
+# comma separated URIs of read replicas of DB_PATH
+DB_REPLICAS = [path.strip() for path
+               in os.getenv('DATABASE_REPLICA_URLS', '').split(',')
+               if path.strip()]
+# seconds between health checks of a replica
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv('DB_REPLICA_CHECK_INTERVAL', 10))
+# writes grouped per transaction by unit_of_work() and the bulk methods
+DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', 1000))
+# ids per DELETE ... WHERE id IN (...) when there's no RETURNING,
+# under SQLite's default limit of bound parameters
+DELETE_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+'''
+ReplicaRouter(engines)
+    hands out read replica engines round-robin, skipping the
+    unhealthy ones. A replica is checked (`SELECT 1`) before its
+    first use and then every `check_interval` seconds; one that
+    fails the check or loses its connection during a query is left
+    out until its next check. engine() returns None when every
+    replica is down, reads then fall back to the primary.
+'''
+
+
+class ReplicaRouter:
+
+    def __init__(self, engines, check_interval=DB_REPLICA_CHECK_INTERVAL,
+                 clock=time.monotonic):
+        self.engines = list(engines)
+        self.check_interval = check_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._cycle = itertools.count()
+        self._healthy = [False] * len(self.engines)
+        self._next_check = [0.0] * len(self.engines)
+        for engine in self.engines:
+            event.listen(engine, 'handle_error', self._handle_error)
+
+    @classmethod
+    def from_paths(cls, paths, **kwargs):
+        return cls([create_engine(path, **engine_options(path))
+                    for path in paths], **kwargs)
+
+    def _handle_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(context.engine)
+
+    def mark_down(self, engine):
+        with self._lock:
+            i = self.engines.index(engine)
+            self._healthy[i] = False
+            self._next_check[i] = self.clock() + self.check_interval
+        logger.warning('read replica %s is down', engine.url)
+
+    def _check(self, i):
+        try:
+            with self.engines[i].connect() as connection:
+                connection.execute(text('SELECT 1'))
+            healthy = True
+        except SQLAlchemyError:
+            healthy = False
+        with self._lock:
+            self._healthy[i] = healthy
+            self._next_check[i] = self.clock() + self.check_interval
+        return healthy
+
+    def healthy(self, i):
+        if self.clock() >= self._next_check[i]:
+            return self._check(i)
+        return self._healthy[i]
+
+    def engine(self):
+        for _ in range(len(self.engines)):
+            i = next(self._cycle) % len(self.engines)
+            if self.healthy(i):
+                return self.engines[i]
+        return None
+
+    def dispose(self):
+        for engine in self.engines:
+            engine.dispose()
+
+
+'''
+RoutingSession
+    the session of `db`. Once use_replicas() marked it read-only,
+    its reads go to one replica (the same for the whole request)
+    until it writes: a flush or an INSERT/UPDATE/DELETE statement
+    switches it to the primary for the rest of the request, so the
+    request reads its own writes.
+'''
+
+
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        router = self.app.extensions.get('db_replicas')
+        if router is not None and self.info.get('use_replicas'):
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info['use_replicas'] = False
+            else:
+                if 'replica' not in self.info:
+                    self.info['replica'] = router.engine()
+                if self.info['replica'] is not None:
+                    return self.info['replica']
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        return shared_engine(sa_url, engine_opts)
+
+
+'''
+shared_engine(sa_url, options)
+    one engine (and connection pool) per database URL and options in
+    the process, reused by every app bound to that database instead
+    of each app opening its own pool. In-memory SQLite databases are
+    private to their engine and are never shared.
+'''
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def shared_engine(sa_url, options):
+    if sa_url.get_backend_name() == 'sqlite' and \
+            sa_url.database in (None, '', ':memory:'):
+        return create_engine(sa_url, **options)
+    key = (sa_url.render_as_string(hide_password=False),
+           repr(sorted(options.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = create_engine(sa_url, **options)
+        return engine
+
+
+db = RoutingSQLAlchemy()
+
+
+'''
+use_replicas(enabled=True)
+    lets the reads of the current session (request) go to the read
+    replicas, if any were given to setup_db().
+'''
+
+
+def use_replicas(enabled=True):
+    info = db.session.info
+    info['use_replicas'] = enabled
+    info.pop('replica', None)
+
+
+'''
+reads_from_primary(loader)
+    decorator for the loaders of the in-memory caches and indexes:
+    they outlive the request and are rebuilt right after this
+    process's own writes, so they read from the primary even in a
+    request routed to a replica that may lag behind.
+'''
+
+
+def reads_from_primary(loader):
+    @functools.wraps(loader)
+    def wrapper(*args, **kwargs):
+        info = db.session.info
+        enabled = info.get('use_replicas', False)
+        info['use_replicas'] = False
+        try:
+            return loader(*args, **kwargs)
+        finally:
+            info['use_replicas'] = enabled
+    return wrapper
+
+
+SEARCH_INDEXES_DDL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_questions_question_trgm '
+    'ON questions USING gin (question gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm '
+    'ON questions USING gin (answer gin_trgm_ops)',
+]
+
+'''
+engine_options(database_path)
+    SQLAlchemy engine options from the DB_* environment variables.
+    Pool sizing and the statement timeout only apply to Postgres,
+    SQLite manages its own connections.
+'''
+
+
+def engine_options(database_path):
+    options = {'pool_pre_ping': DB_POOL_PRE_PING}
+    if not database_path.startswith('postgresql'):
+        return options
+
+    if DB_NULL_POOL:
+        options['poolclass'] = NullPool
+    else:
+        options.update({
+            'pool_size': DB_POOL_SIZE,
+            'max_overflow': DB_MAX_OVERFLOW,
+            'pool_recycle': DB_POOL_RECYCLE,
+        })
+    if DB_STATEMENT_TIMEOUT:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={}'.format(DB_STATEMENT_TIMEOUT),
+        }
+    return options
 
-db = SQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service.
+    The schema isn't touched, create it with init_db()
+    (`flask init-db`).
+    replica_paths are read replicas of database_path
+    (DATABASE_REPLICA_URLS by default), see RoutingSession.
 '''
 
 
-def setup_db(app, database_path=DB_PATH):
+def setup_db(app, database_path=DB_PATH, replica_paths=None):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
+    if replica_paths is None:
+        replica_paths = DB_REPLICAS
+    previous = app.extensions.pop('db_replicas', None)
+    if previous is not None:
+        previous.dispose()
+    if replica_paths:
+        app.extensions['db_replicas'] = ReplicaRouter.from_paths(
+            replica_paths)
     db.app = app
     db.init_app(app)
+    # rebinding an app to another database reloads its in-memory state
+    for listener in list(app.extensions.get('question_listeners', ())):
+        listener.question_changed('reload', None)
+
+
+'''
+init_db()
+    creates the missing tables and the search indexes.
+'''
+
+
+def init_db():
     db.create_all()
+    create_search_indexes()
+
+
+'''
+create_search_indexes()
+    creates the trigram GIN indexes used by ILIKE '%term%' searches
+    on Postgres. Postgres keeps them up to date on every write.
+    Other databases are left untouched.
+'''
+
+
+def create_search_indexes():
+    if db.engine.dialect.name != 'postgresql':
+        return
+    try:
+        with db.engine.begin() as connection:
+            for statement in SEARCH_INDEXES_DDL:
+                connection.execute(text(statement))
+    except SQLAlchemyError:
+        logger.warning('could not create the search indexes, '
+                       'searches will use the in-process index')
+
+
+'''
+has_trigram_support(connection)
+    whether the database can rank searches with pg_trgm: Postgres
+    with the extension installed (see create_search_indexes()).
+'''
+
+
+TRIGRAM_EXTENSION_SQL = "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+
+
+def has_trigram_support(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(text(TRIGRAM_EXTENSION_SQL)).first() \
+        is not None
+
+
+'''
+TableVersions
+    per-table change counters of this process, bumped on every write
+    made through the models. Used to tag cached responses (ETags).
+'''
+
+
+class TableVersions:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def get(self, table):
+        return self._versions.get(table, 0)
+
+    def bump(self, table):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+
+table_versions = TableVersions()
+
+
+'''
+Question listeners
+    objects with a `question_changed(action, question)` method,
+    called after Question.insert(), update() and delete() committed
+    ('insert', 'update' or 'delete'), or with ('reload', None) after
+    a bulk change of many questions.
+    Listeners belong to an app (app.extensions['question_listeners'])
+    and only hear the writes made in that app's context, so apps of
+    the same process bound to other databases don't see them.
+    Listeners are weakly referenced, they go away with their owner.
+'''
+
+
+def add_question_listener(listener, app=None):
+    if app is None:
+        app = current_app._get_current_object()
+    app.extensions.setdefault('question_listeners',
+                              weakref.WeakSet()).add(listener)
+    return listener
+
+
+def notify_question_changed(action, question):
+    table_versions.bump('questions')
+    if not has_app_context():
+        return
+    listeners = current_app.extensions.get('question_listeners', ())
+    for listener in list(listeners):
+        listener.question_changed(action, question)
+
+
+'''
+Question stats
+    denormalized question counts per (category, difficulty), kept
+    in the question_stats table by the same transaction as the
+    write: Question.insert(), update() and delete() and the bulk
+    import add their deltas before committing.
+    Questions without a category or difficulty are counted
+    under 0.
+'''
+
+
+def stat_key(category, difficulty):
+    return (int(category or 0), int(difficulty or 0))
+
+
+def question_stat_statements(deltas, dialect_name):
+    insert = {'postgresql': postgresql.insert,
+              'sqlite': sqlite.insert}[dialect_name]
+    table = QuestionStat.__table__
+    statements = []
+    for (category, difficulty), delta in sorted(deltas.items()):
+        if delta == 0:
+            continue
+        statements.append(insert(table)
+                          .values(category=category, difficulty=difficulty,
+                                  count=delta)
+                          .on_conflict_do_update(
+                              index_elements=['category', 'difficulty'],
+                              set_={'count': table.c.count + delta}))
+    return statements
+
+
+def add_question_stats(deltas):
+    for statement in question_stat_statements(
+            deltas, db.engine.dialect.name):
+        db.session.execute(statement)
+
+
+REBUILD_STATS_SQL = [
+    'DELETE FROM question_stats',
+    'INSERT INTO question_stats (category, difficulty, count) '
+    'SELECT COALESCE(category, 0), COALESCE(difficulty, 0), COUNT(*) '
+    'FROM questions GROUP BY COALESCE(category, 0), COALESCE(difficulty, 0)',
+]
+
+
+'''
+rebuild_question_stats(connection)
+    recounts question_stats from the questions table, e.g. after
+    rows were written without going through the models.
+'''
+
+
+def rebuild_question_stats(connection):
+    for statement in REBUILD_STATS_SQL:
+        connection.execute(text(statement))
+
+
+'''
+UnitOfWork(batch_size)
+    groups the writes of Question.insert(), update(), delete() and
+    the bulk methods made inside `with unit_of_work():` into
+    transactions of batch_size writes: their question_stats deltas
+    are summed and added once, and the listeners are told after
+    each commit (a single 'reload' when a bulk change is among
+    them). Leaving the block commits the last batch, an exception
+    rolls it back; batches committed before stay.
+'''
+
+
+class UnitOfWork:
+
+    def __init__(self, batch_size=DB_WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._changes = []
+        self._deltas = Counter()
+
+    def add(self, action, question, deltas):
+        self._changes.append((action, question))
+        self._deltas.update(deltas)
+        if len(self._changes) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        add_question_stats(self._deltas)
+        db.session.commit()
+        changes, self._changes, self._deltas = self._changes, [], Counter()
+        if any(action == 'reload' for action, _ in changes):
+            notify_question_changed('reload', None)
+            return
+        for action, question in changes:
+            notify_question_changed(action, question)
+
+    def rollback(self):
+        db.session.rollback()
+        self._changes, self._deltas = [], Counter()
+
+    def __enter__(self):
+        info = db.session.info
+        if info.get('unit_of_work') is not None:
+            raise RuntimeError('unit_of_work() blocks do not nest')
+        info['unit_of_work'] = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        db.session.info.pop('unit_of_work', None)
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+
+def unit_of_work(batch_size=DB_WRITE_BATCH_SIZE):
+    return UnitOfWork(batch_size)
+
+
+'''
+write_question_change(action, question, deltas)
+    commits a change with its question_stats deltas and tells the
+    listeners, or leaves it to the current unit of work.
+'''
+
+
+def write_question_change(action, question, deltas):
+    unit = db.session.info.get('unit_of_work')
+    if unit is not None:
+        unit.add(action, question, deltas)
+        return
+    add_question_stats(deltas)
+    db.session.commit()
+    notify_question_changed(action, question)
 
 
 '''
@@ -34,11 +523,15 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id'))
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
@@ -47,16 +540,125 @@ class Question(db.Model):
         self.category = category
         self.difficulty = difficulty
 
+    def _stat_key(self, previous=False):
+        values = []
+        for attribute in ('category', 'difficulty'):
+            history = inspect(self).attrs[attribute].history
+            if previous and history.deleted:
+                values.append(history.deleted[0])
+            else:
+                values.append(getattr(self, attribute))
+        return stat_key(*values)
+
+    '''
+    stat_deltas(action)
+        the question_stats deltas of inserting, updating or deleting
+        this question, taken before the change is flushed.
+    '''
+    def stat_deltas(self, action):
+        if action == 'insert':
+            return {self._stat_key(): 1}
+        if action == 'delete':
+            return {self._stat_key(): -1}
+        deltas = Counter({self._stat_key(): 1})
+        deltas[self._stat_key(previous=True)] -= 1
+        return deltas
+
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        write_question_change('insert', self, self.stat_deltas('insert'))
 
     def update(self):
-        db.session.commit()
+        write_question_change('update', self, self.stat_deltas('update'))
 
     def delete(self):
+        deltas = self.stat_deltas('delete')
         db.session.delete(self)
-        db.session.commit()
+        write_question_change('delete', self, deltas)
+
+    '''
+    bulk_insert(rows)
+        inserts dicts of column values with executemany, one
+        transaction per batch_size rows. Returns the number of rows.
+    '''
+    @staticmethod
+    def bulk_insert(rows, batch_size=DB_WRITE_BATCH_SIZE):
+        inserted = 0
+        for batch in _batches(rows, batch_size):
+            db.session.execute(Question.__table__.insert(), batch)
+            write_question_change('reload', None, Counter(
+                stat_key(row['category'], row['difficulty'])
+                for row in batch))
+            inserted += len(batch)
+        return inserted
+
+    '''
+    bulk_delete(ids, category)
+        deletes the questions with the given ids and/or of the
+        given category and returns how many there were.
+    '''
+    @staticmethod
+    def bulk_delete(ids=None, category=None):
+        deltas = Question.delete_matching(db.session(), ids, category)
+        if not deltas:
+            return 0
+        write_question_change('reload', None, deltas)
+        return -sum(deltas.values())
+
+    '''
+    delete_matching(session, ids, category)
+        deletes the matching questions in `session` without
+        committing and returns the question_stats deltas of the rows
+        it deleted. The (category, difficulty) pairs come back from
+        DELETE ... RETURNING, so a row committed concurrently is
+        counted if and only if it was deleted. Without RETURNING
+        (SQLite before SQLAlchemy 2) the rows are read first and
+        exactly their ids deleted.
+    '''
+    @staticmethod
+    def delete_matching(session, ids=None, category=None):
+        table = Question.__table__
+        delete = table.delete().where(
+            and_(*Question.bulk_delete_conditions(ids, category)))
+        # a DELETE clause also moves a replica-routed session to the
+        # primary, before the SELECT below
+        dialect = session.get_bind(clause=delete).dialect
+        if dialect.full_returning:
+            rows = session.execute(delete.returning(
+                table.c.category, table.c.difficulty)).all()
+        else:
+            selected = session.execute(
+                select(table.c.id, table.c.category, table.c.difficulty)
+                .where(delete.whereclause).with_for_update()).all()
+            for batch in _batches([row[0] for row in selected],
+                                  DELETE_BATCH_SIZE):
+                session.execute(table.delete()
+                                .where(table.c.id.in_(batch)))
+            rows = [row[1:] for row in selected]
+        deltas = Counter()
+        for key in rows:
+            deltas[stat_key(*key)] -= 1
+        return deltas
+
+    @staticmethod
+    def bulk_delete_conditions(ids=None, category=None):
+        conditions = []
+        if ids is not None:
+            conditions.append(Question.id.in_(ids))
+        if category is not None:
+            conditions.append(Question.category == category)
+        if not conditions:
+            raise ValueError('bulk_delete needs ids or a category')
+        return conditions
+
+    @staticmethod
+    def in_categories(categories):
+        # None stands for the questions without a category
+        condition = Question.category.in_(
+            [category for category in categories if category is not None])
+        if None in categories:
+            condition = or_(condition, Question.category.is_(None))
+        return condition
 
     def format(self):
         return {
@@ -68,6 +670,31 @@ class Question(db.Model):
         }
 
 
+def _batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+'''
+QuestionStat
+
+'''
+
+
+class QuestionStat(db.Model):
+    __tablename__ = 'question_stats'
+
+    category = Column(Integer, primary_key=True, autoincrement=False)
+    difficulty = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+
 '''
 Category
 
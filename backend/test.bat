@@ -1,4 +1,9 @@
 dropdb trivia_test
 createdb trivia_test
 psql trivia_test < trivia.psql
-python test_flaskr.py
\ No newline at end of file
+python test_flaskr.py
+python test_migrations.py
+python test_asgi.py
+python test_coherency.py
+python test_replicas.py
+python test_snapshot.py
\ No newline at end of file
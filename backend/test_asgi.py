@@ -0,0 +1,261 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from models import db, Question, Category
+from flaskr import create_app
+from flaskr.asgi import (WSGI_ONLY_ROUTES, async_database_url,
+                         create_async_app)
+
+
+class AsyncAppTestCase(unittest.TestCase):
+    """This class represents the async app test case"""
+
+    def setUp(self):
+        """Create a small question bank and the async app."""
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine('sqlite:///' + self.path)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Category.__table__.insert(), [
+                {'id': 1, 'type': 'Science'}, {'id': 2, 'type': 'Art'}])
+            connection.execute(Question.__table__.insert(), [{
+                'question': 'Question number %d?' % i,
+                'answer': 'Answer %d' % i,
+                'category': 1 + i % 2,
+                'difficulty': 1 + i % 5,
+            } for i in range(25)])
+        engine.dispose()
+        self.app = create_async_app('sqlite:///' + self.path)
+
+    def tearDown(self):
+        """Executed after reach test"""
+        asyncio.run(self.app.config['ASYNC_ENGINE'].dispose())
+        os.remove(self.path)
+
+    def request(self, method, path, **kwargs):
+        async def call():
+            client = self.app.test_client()
+            response = await client.open(path, method=method, **kwargs)
+            return response.status_code, await response.get_json()
+        return asyncio.run(call())
+
+    def test_async_database_url(self):
+        self.assertEqual(async_database_url('postgresql://u:p@h/trivia'),
+                         'postgresql+asyncpg://u:p@h/trivia')
+        self.assertEqual(async_database_url('sqlite:///trivia.db'),
+                         'sqlite+aiosqlite:///trivia.db')
+
+    def test_get_categories(self):
+        status, data = self.request('GET', '/categories')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['categories'], [{'id': 1, 'type': 'Science'},
+                                              {'id': 2, 'type': 'Art'}])
+
+    def test_get_questions(self):
+        status, data = self.request('GET', '/questions?page=3')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(data['questions']), 5)
+        self.assertEqual(data['total_questions'], 25)
+
+    def test_get_questions_beyond_pages(self):
+        status, data = self.request('GET', '/questions?page=100')
+
+        self.assertEqual(status, 404)
+        self.assertEqual(data['message'], 'Not found')
+
+    def test_get_categories_questions(self):
+        status, data = self.request('GET', '/categories/2/questions')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['questions_num'], 12)
+        self.assertTrue(all(question['category'] == 2
+                            for question in data['questions']))
+
+    def test_get_categories_questions_cursor(self):
+        status, data = self.request('GET', '/categories/2/questions')
+        first_page = [question['id'] for question in data['questions']]
+
+        status, data = self.request('GET', '/categories/2/questions?cursor='
+                                    + data['next_cursor'])
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(data['questions']), 2)
+        self.assertLess(max(first_page), data['questions'][0]['id'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_get_categories_questions_invalid_cursor(self):
+        status, data = self.request('GET',
+                                    '/categories/2/questions?cursor=abc')
+
+        self.assertEqual(status, 400)
+        self.assertEqual(data['message'], 'Bad request')
+
+    def test_get_categories_questions_ndjson(self):
+        async def call():
+            client = self.app.test_client()
+            response = await client.get(
+                '/categories/2/questions?format=ndjson')
+            return response.mimetype, await response.get_data()
+        mimetype, body = asyncio.run(call())
+        lines = [json.loads(line) for line in body.splitlines()]
+
+        self.assertEqual(mimetype, 'application/x-ndjson')
+        self.assertEqual(len(lines), 12)
+        self.assertTrue(all(question['category'] == 2
+                            for question in lines))
+
+    def test_suggest_questions(self):
+        status, data = self.request('GET',
+                                    '/questions/suggest?prefix=number%2012')
+
+        self.assertEqual(status, 200)
+        self.assertEqual([suggestion['question']
+                          for suggestion in data['suggestions']],
+                         ['Question number 12?'])
+
+        status, data = self.request('GET', '/questions/suggest?prefix=%20')
+        self.assertEqual(status, 400)
+
+    def test_bulk_delete_questions(self):
+        status, data = self.request('DELETE', '/questions',
+                                    json={'ids': [1, 2, 3], 'category': 1})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['total_questions'], 23)
+        status, data = self.request('GET', '/stats')
+        self.assertEqual(data['categories'][0]['total_questions'], 11)
+
+        status, data = self.request('DELETE', '/questions', json={})
+        self.assertEqual(status, 422)
+
+    def test_bulk_import_streamed(self):
+        # past Quart's default MAX_CONTENT_LENGTH of 16 MiB
+        padding = 'x' * 10000
+        lines = [json.dumps({'question': 'Bulk {} {}?'.format(i, padding),
+                             'answer': 'Yes', 'difficulty': 1,
+                             'category': 100 if i == 1499 else 1})
+                 for i in range(1700)]
+        status, data = self.request('POST', '/questions/bulk',
+                                    data='\n'.join(lines).encode(),
+                                    headers={'Content-Type':
+                                             'application/x-ndjson'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['imported'], 1699)
+        self.assertEqual([error['row'] for error in data['errors']], [1500])
+        status, data = self.request('GET', '/stats')
+        self.assertEqual(data['total_questions'], 25 + 1699)
+
+    def test_same_api_as_wsgi_app(self):
+        wsgi_app = create_app('sqlite:///' + self.path)
+
+        def routes(app):
+            return {(rule.rule, method) for rule in app.url_map.iter_rules()
+                    for method in rule.methods - {'HEAD', 'OPTIONS'}
+                    if rule.endpoint != 'static'}
+
+        self.assertEqual(routes(self.app),
+                         routes(wsgi_app) - WSGI_ONLY_ROUTES)
+        self.assertEqual(set(self.app.error_handler_spec[None]),
+                         set(wsgi_app.error_handler_spec[None]))
+
+    def test_get_stats(self):
+        status, data = self.request('GET', '/stats')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total_questions'], 25)
+        self.assertEqual(data['categories'][1]['total_questions'], 12)
+        self.assertEqual(data['difficulties']['1'], 5)
+
+    def test_search_questions(self):
+        status, data = self.request('POST', '/questions/search',
+                                    json={'searchTerm': 'number 1'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['questions_num'], 11)
+
+    def test_create_and_delete_question(self):
+        status, data = self.request('POST', '/questions', json={
+            'question': 'Async?', 'answer': 'Yes',
+            'difficulty': 1, 'category': 1})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total_questions'], 26)
+
+        status, data = self.request('DELETE',
+                                    '/questions/{}'.format(data['created']))
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total_questions'], 25)
+
+    def test_create_question_unknown_category(self):
+        status, data = self.request('POST', '/questions', json={
+            'question': 'Async?', 'answer': 'Yes',
+            'difficulty': 1, 'category': 100})
+
+        self.assertEqual(status, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_quizzes(self):
+        status, data = self.request('POST', '/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'Art', 'id': 2}})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['question']['category'], 2)
+
+    def test_quizzes_question_deleted_elsewhere(self):
+        self.request('POST', '/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'Art', 'id': 2}})
+        engine = create_engine('sqlite:///' + self.path)
+        with engine.begin() as connection:
+            connection.execute(Question.__table__.delete().where(
+                Question.category == 2, Question.id != 24))
+        engine.dispose()
+
+        for path, key in (('/quizzes', 'question'),
+                          ('/quizzes/batch', 'questions')):
+            status, data = self.request('POST', path, json={
+                'previous_questions': [], 'questions_num': 1,
+                'quiz_category': {'type': 'Art', 'id': 2}})
+
+            self.assertEqual(status, 200)
+            played = data[key] if key == 'questions' else [data[key]]
+            self.assertEqual([question['id'] for question in played], [24])
+
+    def test_quizzes_batch(self):
+        status, data = self.request('POST', '/quizzes/batch', json={
+            'questions_num': 4, 'previous_questions': [2, 4],
+            'quiz_category': {'type': 'Art', 'id': 2}})
+        played = [question['id'] for question in data['questions']]
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(set(played)), 4)
+        self.assertFalse(set(played) & {2, 4})
+
+    def test_quiz_session(self):
+        status, data = self.request('POST', '/quizzes/sessions', json={
+            'questions_num': 3, 'quiz_category': {'type': 'all'}})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['total_questions'], 3)
+
+        path = '/quizzes/sessions/{}/next'.format(data['session_id'])
+        status, data = self.request('GET', path)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(data['remaining_questions'], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
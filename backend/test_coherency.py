@@ -0,0 +1,141 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from flaskr import create_app
+from flaskr.coherency import SharedMemoryVersionStore
+from flaskr.quiz import QuestionPicker
+from models import db, Question, Category
+
+
+def bump_counter(versions_path, times):
+    store = SharedMemoryVersionStore(versions_path)
+    for _ in range(times):
+        store.bump('questions')
+    store.close()
+
+
+def create_question(database_path, versions_path, category, text):
+    app = create_app(database_path,
+                     version_store=SharedMemoryVersionStore(versions_path))
+    res = app.test_client().post('/questions', json={
+        'question': text, 'answer': 'Yes', 'difficulty': 1,
+        'category': category})
+    assert res.status_code == 200, res.data
+
+
+class CacheCoherencyTestCase(unittest.TestCase):
+    """This class represents the cross-process cache test case"""
+
+    def setUp(self):
+        """Create a small question bank and a version counters file."""
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        fd, self.versions_path = tempfile.mkstemp(suffix='.versions')
+        os.close(fd)
+        self.database_path = 'sqlite:///' + self.path
+        engine = create_engine(self.database_path)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Category.__table__.insert(), [
+                {'id': 1, 'type': 'Science'}, {'id': 2, 'type': 'Art'}])
+            connection.execute(Question.__table__.insert(), [{
+                'id': i + 1,
+                'question': 'Question number %d?' % i,
+                'answer': 'Answer %d' % i,
+                'category': 1 + i % 2,
+                'difficulty': 1,
+            } for i in range(10)])
+        engine.dispose()
+        self.context = multiprocessing.get_context('spawn')
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.get_engine().dispose()
+        os.remove(self.path)
+        os.remove(self.versions_path)
+
+    def run_process(self, target, *args):
+        process = self.context.Process(target=target, args=args)
+        process.start()
+        process.join(60)
+        self.assertEqual(process.exitcode, 0)
+
+    def test_shared_counter_across_processes(self):
+        processes = [self.context.Process(target=bump_counter,
+                                          args=(self.versions_path, 200))
+                     for _ in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+        store = SharedMemoryVersionStore(self.versions_path)
+
+        self.assertEqual(store.slot_value(store.snapshot(), 'questions'),
+                         600)
+        store.close()
+
+    def test_write_in_other_process(self):
+        app = create_app(self.database_path,
+                         version_store=SharedMemoryVersionStore(
+                             self.versions_path))
+        client = app.test_client()
+        art_ids = [2, 4, 6, 8, 10]
+        quiz = {'previous_questions': art_ids,
+                'quiz_category': {'type': 'Art', 'id': 2}}
+
+        res = client.post('/quizzes', json=quiz)
+        self.assertEqual(json.loads(res.data)['question'], None)
+        res = client.post('/questions/search',
+                          json={'searchTerm': 'coherent'})
+        self.assertEqual(res.status_code, 404)
+
+        self.run_process(create_question, self.database_path,
+                         self.versions_path, 2, 'Is this coherent?')
+
+        res = client.post('/quizzes', json=quiz)
+        self.assertEqual(json.loads(res.data)['question']['question'],
+                         'Is this coherent?')
+        res = client.post('/questions/search',
+                          json={'searchTerm': 'coherent'})
+        self.assertEqual(json.loads(res.data)['questions_num'], 1)
+
+    def test_own_writes_not_replayed(self):
+        app = create_app(self.database_path,
+                         version_store=SharedMemoryVersionStore(
+                             self.versions_path))
+        client = app.test_client()
+        client.get('/categories')
+        client.post('/questions', json={
+            'question': 'Mine?', 'answer': 'Yes', 'difficulty': 1,
+            'category': 1})
+
+        self.assertEqual(app.extensions['cache_coherency'].poll(), [])
+
+    def test_picker_reloads_stale_category_only(self):
+        rows = [(1, 1, 1), (2, 2, 1), (3, 1, 2)]
+        loads = []
+
+        def loader(categories=None):
+            loads.append(categories)
+            return [row for row in rows
+                    if categories is None or row[1] in categories]
+
+        picker = QuestionPicker(loader=loader)
+        self.assertEqual(sorted(picker.ids()), [1, 2, 3])
+        rows.append((4, 2, 3))
+        picker.invalidate_category(2)
+
+        self.assertEqual(sorted(picker.ids(2)), [2, 4])
+        self.assertEqual(sorted(picker.ids()), [1, 2, 3, 4])
+        self.assertEqual(picker.ids(2, 3), [4])
+        self.assertEqual(loads, [None, [2]])
+
+
+if __name__ == "__main__":
+    unittest.main()
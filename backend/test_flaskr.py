@@ -1,10 +1,22 @@
+import io
 import os
 import unittest
 import json
+import tempfile
+from unittest import mock
+from sqlalchemy import create_engine
 from flask_sqlalchemy import SQLAlchemy
 
-from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr import create_app, serialization
+from flaskr.bulk import read_rows, validated_batches
+from flaskr.cache import CategoryCache
+from flaskr.coherency import SharedMemoryVersionStore
+from flaskr.pagination import encode_cursor
+from flaskr.quiz import (MAX_QUIZ_SESSION, QUIZ_SESSION_SIZE, QuestionPicker,
+                         quiz_session_size)
+from flaskr.suggest import MAX_SUGGEST_SCAN, PrefixIndex
+from models import (db, setup_db, init_db, unit_of_work, Question,
+                    Category)
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -30,6 +42,7 @@ class TriviaTestCase(unittest.TestCase):
             self.db.init_app(self.app)
             # create all tables
             self.db.create_all()
+            init_db()
 
     def tearDown(self):
         """Executed after reach test"""
@@ -43,6 +56,88 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertEqual(len(data['categories']), 6)
 
+    def test_get_categories_from_cache(self):
+        category_cache = self.app.extensions['category_cache']
+        misses = category_cache.stats()['misses']
+
+        self.client().get('/categories')
+        self.client().get('/questions')
+        stats = category_cache.stats()
+
+        self.assertEqual(stats['misses'], misses)
+        self.assertGreaterEqual(stats['hits'], 2)
+
+        category_cache.invalidate()
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(len(data['categories']), 6)
+        self.assertEqual(category_cache.stats()['misses'], misses + 1)
+
+    def test_get_questions_server_timing(self):
+        res = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('db;dur=', res.headers['Server-Timing'])
+
+    def test_metrics(self):
+        self.client().get('/questions')
+        res = self.client().get('/metrics')
+        text = res.data.decode()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('trivia_requests_total{method="GET",route="/questions",'
+                      'status="200"} 1', text)
+        self.assertIn('trivia_db_statements_total{method="GET",'
+                      'route="/questions"}', text)
+        self.assertIn('trivia_category_cache_hits_total', text)
+
+    def shared_versions_client(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        store = SharedMemoryVersionStore(path)
+        self.addCleanup(store.close)
+        app = create_app(version_store=store)
+        setup_db(app, self.database_path)
+        return app.test_client
+
+    def test_get_categories_not_modified(self):
+        client = self.shared_versions_client()
+        res = client().get('/categories')
+        etag = res.headers['ETag']
+
+        res = client().get('/categories',
+                           headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    def test_get_questions_etag_changes_on_write(self):
+        client = self.shared_versions_client()
+        etag = client().get('/questions').headers['ETag']
+        res = client().post('/questions', json={
+                                'question': 'Is this cached?',
+                                'answer': 'No',
+                                'difficulty': '1',
+                                'category': '4',
+                            })
+        created = json.loads(res.data)['created']
+
+        res = client().get('/questions',
+                           headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        client().delete('/questions/{}'.format(created))
+
+    def test_no_etag_without_shared_versions(self):
+        res = self.client().get('/questions')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('ETag', res.headers)
+        self.assertEqual(res.headers['Cache-Control'], 'no-cache')
+
     def test_get_questions_without_pages(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -63,6 +158,17 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data['questions']), 9)
         self.assertEqual(len(data['categories']), 6)
 
+    def test_get_questions_standard_json_encoder(self):
+        res = self.client().get('/questions?page=2')
+        with mock.patch.object(serialization, 'orjson', None):
+            fallback = self.client().get('/questions?page=2')
+
+        self.assertEqual(fallback.status_code, 200)
+        self.assertEqual(json.loads(fallback.data), json.loads(res.data))
+        self.assertEqual(json.loads(res.data)['questions'][0],
+                         Question.query.get(json.loads(res.data)
+                                            ['questions'][0]['id']).format())
+
     def test_get_questions_with_pages_error(self):
         res = self.client().get('/questions?page=900')
         data = json.loads(res.data)
@@ -72,6 +178,24 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertEqual(data['message'], "Not found")
 
+    def test_get_questions_after_id(self):
+        res = self.client().get('/questions?after_id=12')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['questions']), 10)
+        self.assertEqual(data['questions'][0]['id'], 13)
+        self.assertEqual(data['total_questions'], 19)
+
+    def test_get_questions_after_last_id_error(self):
+        res = self.client().get('/questions?after_id=1000')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['error'], 404)
+
     def test_delete_question(self):
         res = self.client().delete('/questions/9')
         data = json.loads(res.data)
@@ -79,7 +203,7 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertEqual(data['deleted'], 9)
-        self.assertEqual(len(data['questions']), 10)
+        self.assertNotIn('questions', data)
         self.assertEqual(data['total_questions'], 19)
 
     def test_delete_question_fail(self):
@@ -91,6 +215,57 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 422)
         self.assertEqual(data['message'], "Unprocessable")
 
+    def create_questions(self, texts, category=4):
+        ids = []
+        for text in texts:
+            res = self.client().post('/questions', json={
+                'question': text, 'answer': 'Yes', 'difficulty': '2',
+                'category': str(category)})
+            ids.append(json.loads(res.data)['created'])
+        return ids
+
+    def test_bulk_delete_questions(self):
+        ids = self.create_questions(['Bulk one?', 'Bulk two?', 'Bulk three?'])
+        total = Question.query.count()
+
+        res = self.client().delete('/questions', json={
+            'ids': ids[:2] + [20],
+            'category': 4,
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['total_questions'], total - 2)
+        self.assertIsNotNone(Question.query.get(20))
+        self.client().delete('/questions', json={'ids': ids[2:]})
+
+    def test_bulk_delete_questions_error(self):
+        res = self.client().delete('/questions', json={})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_unit_of_work_commits_batches(self):
+        with self.app.app_context():
+            with self.assertRaises(RuntimeError):
+                with unit_of_work(batch_size=2):
+                    for i in range(3):
+                        Question('Batched {}?'.format(i), 'Yes', 4, 2)\
+                            .insert()
+                    raise RuntimeError('abort the last batch')
+            ids = [question.id for question in Question.query.filter(
+                Question.question.like('Batched %')).all()]
+
+            self.assertEqual(len(ids), 2)
+            self.assertEqual(Question.bulk_delete(ids), 2)
+
+        res = self.client().get('/stats')
+        self.assertEqual(json.loads(res.data)['total_questions'],
+                         Question.query.count())
+
     def test_create_question_success(self):
         res = self.client().post('/questions', json={
                                      'question': 'Do you love me?',
@@ -103,9 +278,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertIsNotNone(data['created'])
-        self.assertEqual(len(data['questions']), 10)
+        self.assertNotIn('questions', data)
         self.assertEqual(data['total_questions'], 20)
 
+    def test_create_and_delete_question_include_page(self):
+        total = json.loads(self.client().get('/questions').data)[
+            'total_questions']
+        res = self.client().post('/questions?include_page=1', json={
+                                     'question': 'Do you still love me?',
+                                     'answer': 'Do you do you?',
+                                     'difficulty': '5',
+                                     'category': '4',
+                                 })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 10)
+        self.assertEqual(data['total_questions'], total + 1)
+
+        res = self.client().delete(
+            '/questions/{}?include_page=1'.format(data['created']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['questions']), 10)
+        self.assertEqual(data['total_questions'], total)
+
     def test_create_question_negative_difficulty_error(self):
         res = self.client().post('/questions', json={
                                      'question': 'Do you love me?',
@@ -199,6 +397,18 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data['questions']), 2)
         self.assertEqual(data['questions_num'], 2)
 
+    def test_questions_search_without_pg_trgm(self):
+        with mock.patch('flaskr.has_trigram_support', return_value=False):
+            app = create_app()
+        setup_db(app, self.database_path)
+        res = app.test_client().post('/questions/search', json={
+            'searchTerm': 'title',
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions_num'], 2)
+
     def test_questions_search_error(self):
         res = self.client().post('/questions/search', json={
             'searchTerm': 'dfadfa',
@@ -210,6 +420,207 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertEqual(data['message'], "Not found")
 
+    def test_questions_search_answers(self):
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'agra',
+            'searchAnswers': True,
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions_num'], 1)
+        self.assertEqual(data['questions'][0]['id'], 15)
+
+    def test_questions_search_answers_not_requested_error(self):
+        res = self.client().post('/questions/search', json={
+            'searchTerm': 'agra',
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+
+    def test_questions_bulk_import_ndjson(self):
+        lines = [
+            json.dumps({'question': 'Bulk question one?', 'answer': 'One',
+                        'difficulty': 1, 'category': 6}),
+            json.dumps({'question': 'Bulk question two?', 'answer': 'Two',
+                        'difficulty': 2, 'category': 6}),
+            json.dumps({'question': 'Bulk question three?', 'answer': 'Three',
+                        'difficulty': 2, 'category': 60}),
+            'not json',
+        ]
+        res = self.client().post('/questions/bulk',
+                                 data='\n'.join(lines),
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['imported'], 2)
+        self.assertEqual([error['row'] for error in data['errors']], [3, 4])
+
+    def test_questions_bulk_import_csv(self):
+        res = self.client().post('/questions/bulk',
+                                 data='question,answer,difficulty,category\n'
+                                      'Bulk csv question?,Csv,3,6\n',
+                                 content_type='text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual(data['errors'], [])
+
+    def test_questions_bulk_import_error(self):
+        res = self.client().post('/questions/bulk',
+                                 data='{"question": "No answer?"}',
+                                 content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_questions_bulk_import_invalid_utf8_error(self):
+        for body, content_type in (
+                (b'{"question": "Caf\xe9?"}', 'application/x-ndjson'),
+                (b'question,answer,difficulty,category\n'
+                 b'Caf\xe9?,Yes,1,1\n', 'text/csv')):
+            res = self.client().post('/questions/bulk', data=body,
+                                     content_type=content_type)
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 422)
+            self.assertEqual(data['success'], False)
+
+    def test_read_rows_invalid_utf8(self):
+        rows = list(read_rows(io.BytesIO(
+            b'question,answer\nOk?,Yes\nCaf\xe9?,Yes\n'), 'text/csv'))
+
+        self.assertEqual(rows[0], {'question': 'Ok?', 'answer': 'Yes'})
+        self.assertEqual(str(rows[1]), 'row is not valid UTF-8')
+
+    def test_validated_batches_text_not_string(self):
+        category_cache = CategoryCache(ttl=None, loader=None)
+        category_cache.fill([{'id': 1, 'type': 'Science'}])
+        errors = []
+        batches = list(validated_batches([
+            {'question': {'x': 1}, 'answer': 'Yes', 'difficulty': 1,
+             'category': 1},
+            {'question': 'Ok?', 'answer': 42, 'difficulty': 1,
+             'category': 1},
+            {'question': 'Ok?', 'answer': 'Yes', 'difficulty': 1,
+             'category': 1},
+        ], category_cache, errors))
+
+        self.assertEqual([len(batch) for batch in batches], [1])
+        self.assertEqual(errors, [
+            {'row': 1, 'message': 'question must be a string'},
+            {'row': 2, 'message': 'answer must be a string'}])
+
+    def test_questions_export(self):
+        total = json.loads(self.client().get('/questions').data)[
+            'total_questions']
+        res = self.client().get('/questions/export')
+        questions = [json.loads(line)
+                     for line in res.data.decode().splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(questions), total)
+        self.assertEqual(sorted(questions[0]),
+                         ['answer', 'category', 'difficulty', 'id',
+                          'question'])
+
+    def test_suggest_questions(self):
+        res = self.client().get('/questions/suggest?prefix=Hema')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['suggestions'], [{
+            'id': 22,
+            'question': 'Hematology is a branch of medicine involving '
+                        'the study of what?',
+        }])
+
+    def test_suggest_questions_several_words(self):
+        res = self.client().get('/questions/suggest?prefix=soccer%20world%20c')
+        data = json.loads(res.data)
+
+        self.assertEqual(sorted(suggestion['id']
+                                for suggestion in data['suggestions']),
+                         [10, 11])
+
+    def test_suggest_questions_follow_writes(self):
+        res = self.client().post('/questions', json={
+                                     'question': 'Zymurgy is the study of?',
+                                     'answer': 'Fermentation',
+                                     'difficulty': '2',
+                                     'category': '1',
+                                 })
+        created = json.loads(res.data)['created']
+        res = self.client().get('/questions/suggest?prefix=zymu')
+        suggestions = json.loads(res.data)['suggestions']
+
+        self.assertEqual([suggestion['id'] for suggestion in suggestions],
+                         [created])
+
+        self.client().delete('/questions/{}'.format(created))
+        res = self.client().get('/questions/suggest?prefix=zymu')
+
+        self.assertEqual(json.loads(res.data)['suggestions'], [])
+
+    def test_question_listeners_per_app(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine('sqlite:///' + path)
+        db.metadata.create_all(engine)
+        other = create_app('sqlite:///' + path).test_client
+        try:
+            other().get('/questions/suggest?prefix=zymu')
+            res = self.client().post('/questions', json={
+                'question': 'Zymurgy is the study of?',
+                'answer': 'Fermentation',
+                'difficulty': '2',
+                'category': '1',
+            })
+            created = json.loads(res.data)['created']
+            res = other().get('/questions/suggest?prefix=zymu')
+            self.client().delete('/questions/{}'.format(created))
+
+            self.assertEqual(json.loads(res.data)['suggestions'], [])
+        finally:
+            engine.dispose()
+            os.remove(path)
+
+    def test_suggest_scan_is_bounded(self):
+        index = PrefixIndex(loader=None)
+        index.fill([(i, 'What is {}?'.format(i), 1)
+                    for i in range(1, MAX_SUGGEST_SCAN + 1)] +
+                   [(MAX_SUGGEST_SCAN + 1, 'Nomatch what?', 1)])
+
+        # gives up once MAX_SUGGEST_SCAN ids were looked at
+        self.assertEqual(index.suggest('nomatch wh'), [])
+        self.assertEqual(len(index.suggest('what')), 5)
+
+    def test_suggest_fill_unordered_rows(self):
+        index = PrefixIndex(loader=None)
+        index.fill([(3, 'Which river?', 1), (1, 'Which ocean?', 1),
+                    (2, 'Whose river?', 2)])
+
+        self.assertEqual([suggestion['id']
+                          for suggestion in index.suggest('wh')], [1, 3, 2])
+        self.assertEqual([suggestion['id']
+                          for suggestion in index.suggest('river')], [2, 3])
+
+    def test_suggest_questions_error(self):
+        res = self.client().get('/questions/suggest?prefix=%20')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
     def test_questions_by_category_success(self):
         res = self.client().get('/categories/1/questions')
         data = json.loads(res.data)
@@ -219,6 +630,32 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(len(data['questions']), 3)
         self.assertEqual(data['questions_num'], 3)
 
+    def test_questions_by_category_cursor(self):
+        res = self.client().get('/categories/1/questions?cursor={}'
+                                .format(encode_cursor(20)))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [21, 22])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_questions_by_category_invalid_cursor(self):
+        res = self.client().get('/categories/1/questions?cursor=x')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['success'], False)
+
+    def test_questions_by_category_ndjson(self):
+        res = self.client().get('/categories/1/questions?format=ndjson'
+                                '&cursor={}'.format(encode_cursor(20)))
+        lines = [json.loads(line) for line in res.data.splitlines()]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual([question['id'] for question in lines], [21, 22])
+
     def test_questions_by_category_error(self):
         res = self.client().get('/categories/9/questions')
         data = json.loads(res.data)
@@ -228,6 +665,37 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 404)
         self.assertEqual(data['message'], "Not found")
 
+    def test_get_stats(self):
+        res = self.client().get('/stats')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], Question.query.count())
+        self.assertEqual(sum(data['difficulties'].values()),
+                         data['total_questions'])
+        self.assertEqual(len(data['categories']), 6)
+        self.assertEqual(data['categories'][0]['total_questions'],
+                         Question.query.filter_by(category=1).count())
+
+    def test_get_stats_follow_writes(self):
+        before = json.loads(self.client().get('/stats').data)
+        res = self.client().post('/questions', json={
+            'question': 'Counted?', 'answer': 'Yes',
+            'difficulty': 4, 'category': 2})
+        created = json.loads(res.data)['created']
+        after = json.loads(self.client().get('/stats').data)
+        self.client().delete('/questions/{}'.format(created))
+        restored = json.loads(self.client().get('/stats').data)
+
+        self.assertEqual(after['total_questions'],
+                         before['total_questions'] + 1)
+        self.assertEqual(after['difficulties']['4'],
+                         before['difficulties'].get('4', 0) + 1)
+        self.assertEqual(after['categories'][1]['total_questions'],
+                         before['categories'][1]['total_questions'] + 1)
+        self.assertEqual(restored, before)
+
     def test_quizzes_success(self):
         res = self.client().post('/quizzes', json={
             'previous_questions': [20, 21],
@@ -248,6 +716,206 @@ class TriviaTestCase(unittest.TestCase):
             "question": "Hematology is a branch of medicine involving the study of what?"   # noqa
         })
 
+    def test_quizzes_category_exhausted(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [20, 21, 22],
+            'quiz_category': {
+                'type': 'Science',
+                'id': 1
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIsNone(data['question'])
+
+    def test_quizzes_all_categories(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [2, 4, 5],
+            'quiz_category': {
+                'type': 'all',
+                'id': 0
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertNotIn(data['question']['id'], [2, 4, 5])
+
+    def test_quizzes_target_difficulty(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'Art', 'id': 2},
+            'difficulty': 3,
+            'difficulty_spread': 0,
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['category'], 2)
+        self.assertEqual(data['question']['difficulty'], 3)
+
+    def test_quizzes_adaptive_difficulty(self):
+        body = {
+            'previous_questions': [],
+            'quiz_category': {'type': 'Art', 'id': 2},
+            'adaptive': True,
+            'difficulty_spread': 0,
+        }
+        difficulties = []
+        for correct_answers in (0, 2, 10):
+            body['correct_answers'] = correct_answers
+            res = self.client().post('/quizzes', json=body)
+            difficulties.append(json.loads(res.data)['question']['difficulty'])
+
+        hardest = max(question.difficulty for question in
+                      Question.query.filter_by(category=2).all())
+        self.assertEqual(difficulties, [1, 3, hardest])
+
+    def test_quizzes_difficulty_weights_exhausted(self):
+        body = {
+            'previous_questions': [],
+            'quiz_category': {'type': 'Art', 'id': 2},
+            'difficulty_weights': {'2': 1},
+        }
+        question = json.loads(self.client().post('/quizzes', json=body)
+                              .data)['question']
+        body['previous_questions'] = [question['id']]
+        res = self.client().post('/quizzes', json=body)
+        data = json.loads(res.data)
+
+        self.assertEqual(question['difficulty'], 2)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question'], None)
+
+    def test_picker_alias_tables_bounded(self):
+        picker = QuestionPicker(loader=None, max_tables=2)
+        picker.fill([(1, 1, 1), (2, 1, 2), (3, 1, 3)])
+        for spread in range(1, 11):
+            picker.pick(1, weights={1: 1, 2: spread / 10, 3: 0.5})
+
+        self.assertEqual(len(picker._tables), 2)
+
+    def test_quizzes_difficulty_spread_error(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': [],
+            'quiz_category': {'type': 'Art', 'id': 2},
+            'difficulty': 3,
+            'difficulty_spread': 2,
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_quiz_session(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'quiz_category': {
+                'type': 'Science',
+                'id': 1
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['total_questions'], 3)
+
+        played = []
+        for _ in range(3):
+            res = self.client().get(
+                '/quizzes/sessions/{}/next'.format(data['session_id']))
+            question = json.loads(res.data)['question']
+            self.assertEqual(question['category'], 1)
+            played.append(question['id'])
+        self.assertEqual(sorted(played), [20, 21, 22])
+
+        res = self.client().get(
+            '/quizzes/sessions/{}/next'.format(data['session_id']))
+        self.assertIsNone(json.loads(res.data)['question'])
+
+    def test_quiz_session_questions_num(self):
+        res = self.client().post('/quizzes/sessions', json={
+            'questions_num': 2,
+            'quiz_category': {
+                'type': 'all',
+                'id': 0
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 2)
+
+    def test_quiz_session_size(self):
+        self.assertEqual(quiz_session_size({}), QUIZ_SESSION_SIZE)
+        self.assertEqual(quiz_session_size({'questions_num': 10 ** 6}),
+                         MAX_QUIZ_SESSION)
+        with self.assertRaises(ValueError):
+            quiz_session_size({'questions_num': 0})
+
+    def test_quiz_session_not_found_error(self):
+        res = self.client().get('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Not found")
+
+    def test_quizzes_batch(self):
+        res = self.client().post('/quizzes/batch', json={
+            'questions_num': 5,
+            'previous_questions': [2, 4, 5],
+            'quiz_category': {
+                'type': 'all',
+                'id': 0
+            }
+        })
+        data = json.loads(res.data)
+        played = [question['id'] for question in data['questions']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['questions_num'], 5)
+        self.assertEqual(len(set(played)), 5)
+        self.assertFalse(set(played) & {2, 4, 5})
+
+    def test_quizzes_batch_category_runs_out(self):
+        res = self.client().post('/quizzes/batch', json={
+            'previous_questions': [21],
+            'quiz_category': {
+                'type': 'Science',
+                'id': 1
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(sorted(question['id']
+                                for question in data['questions']), [20, 22])
+
+    def test_quizzes_batch_error(self):
+        res = self.client().post('/quizzes/batch', json={
+            'questions_num': 0,
+            'quiz_category': {
+                'type': 'all',
+                'id': 0
+            }
+        })
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_quiz_session_error(self):
+        res = self.client().post('/quizzes/sessions')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     def test_quizzes_error(self):
         res = self.client().post('/quizzes')
         data = json.loads(res.data)
@@ -257,6 +925,58 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['error'], 422)
         self.assertEqual(data['message'], "Unprocessable")
 
+    def test_rate_limit_error(self):
+        self.app.extensions['rate_limiter'].routes = {'quizzes': (0.001, 2)}
+        body = {'previous_questions': [],
+                'quiz_category': {'type': 'all', 'id': 0}}
+        statuses = [self.client().post('/quizzes', json=body).status_code
+                    for _ in range(3)]
+        res = self.client().post('/quizzes', json=body)
+        data = json.loads(res.data)
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "Too many requests")
+        self.assertEqual(res.headers['Retry-After'], '1000')
+        # other clients and other routes keep their budgets
+        res = self.client().post('/quizzes', json=body,
+                                 environ_base={'REMOTE_ADDR': '10.0.0.2'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.client().get('/categories').status_code, 200)
+
+    def test_concurrency_limit_error(self):
+        concurrency_limit = self.app.extensions['concurrency_limit']
+        concurrency_limit.max_requests = 1
+        concurrency_limit.enter()
+        res = self.client().get('/categories')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['message'], "Service unavailable")
+        self.assertEqual(res.headers['Retry-After'], '1')
+
+        concurrency_limit.leave()
+        self.assertEqual(self.client().get('/categories').status_code, 200)
+        self.assertEqual(concurrency_limit.in_flight, 0)
+
+    def test_create_app_shares_engine(self):
+        first, second = create_app(), create_app()
+        with first.app_context():
+            engine = db.engine
+        with second.app_context():
+            self.assertIs(db.engine, engine)
+
+        phases = first.extensions['startup_profile'].as_dict()
+        self.assertEqual(list(phases)[:3], ['flask', 'setup_db', 'middleware'])
+        self.assertEqual(list(phases)[-1], 'routes')
+
+    def test_cors_headers(self):
+        res = self.client().get('/categories')
+
+        self.assertEqual(res.headers.getlist('Access-Control-Allow-Origin'),
+                         ['*'])
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import Integer, create_engine, inspect, text
+
+from migrations import run_migrations
+
+
+class MigrationsTestCase(unittest.TestCase):
+    """This class represents the schema migrations test case"""
+
+    def setUp(self):
+        """Create a database with the legacy questions schema."""
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine('sqlite:///' + self.path)
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                'CREATE TABLE categories (id INTEGER PRIMARY KEY, type TEXT)'))
+            connection.execute(text(
+                'CREATE TABLE questions (id INTEGER PRIMARY KEY, '
+                'question VARCHAR, answer VARCHAR, category VARCHAR, '
+                'difficulty INTEGER)'))
+            connection.execute(text(
+                "INSERT INTO categories (id, type) VALUES (1, 'Science')"))
+            for i in range(1, 26):
+                connection.execute(text(
+                    "INSERT INTO questions (id, question, answer, category, "
+                    "difficulty) VALUES (:id, 'q', 'a', '1', 2)"), {'id': i})
+
+    def tearDown(self):
+        """Executed after reach test"""
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_migrations(self):
+        applied = run_migrations(self.engine, batch_size=10)
+
+        self.assertEqual(applied, ['0001_question_category_integer',
+                                   '0002_question_category_foreign_key',
+                                   '0003_question_filter_indexes',
+                                   '0004_question_stats',
+                                   '0005_search_indexes'])
+        columns = {column['name']: column['type'] for column in
+                   inspect(self.engine).get_columns('questions')}
+        self.assertIsInstance(columns['category'], Integer)
+        indexes = [index['name'] for index in
+                   inspect(self.engine).get_indexes('questions')]
+        self.assertIn('ix_questions_category_id', indexes)
+        self.assertIn('ix_questions_category_difficulty', indexes)
+
+        with self.engine.connect() as connection:
+            categories = connection.execute(text(
+                'SELECT DISTINCT category FROM questions')).all()
+        self.assertEqual(categories, [(1,)])
+
+        with self.engine.connect() as connection:
+            stats = connection.execute(text(
+                'SELECT category, difficulty, count FROM question_stats'))\
+                .all()
+        self.assertEqual(stats, [(1, 2, 25)])
+
+    def test_migrations_repeatable(self):
+        run_migrations(self.engine)
+
+        self.assertEqual(run_migrations(self.engine), [])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
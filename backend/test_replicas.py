@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from flaskr import create_app
+from models import (db, rebuild_question_stats, ReplicaRouter, Question,
+                    QuestionStat, Category)
+
+
+class ReadReplicaTestCase(unittest.TestCase):
+    """This class represents the read replica test case"""
+
+    def setUp(self):
+        """Create a primary and a replica two questions ahead."""
+        self.directory = tempfile.mkdtemp()
+        self.primary = os.path.join(self.directory, 'primary.db')
+        self.replica = os.path.join(self.directory, 'replica.db')
+        self.seed(self.primary, [])
+        self.seed(self.replica, [{'question': question, 'answer': 'Yes',
+                                  'category': 1, 'difficulty': 1}
+                                 for question in ('Only on the replica?',
+                                                  'Replica again?')])
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.get_engine().dispose()
+        shutil.rmtree(self.directory)
+
+    def seed(self, path, extra_questions):
+        engine = create_engine('sqlite:///' + path)
+        db.metadata.create_all(engine)
+        with engine.begin() as connection:
+            connection.execute(Category.__table__.insert(), [
+                {'id': 1, 'type': 'Science'}, {'id': 2, 'type': 'Art'}])
+            connection.execute(Question.__table__.insert(), [{
+                'question': 'Question number %d?' % i,
+                'answer': 'Answer %d' % i,
+                'category': 1 + i % 2,
+                'difficulty': 1,
+            } for i in range(10)] + extra_questions)
+            rebuild_question_stats(connection)
+        engine.dispose()
+
+    def create_app(self, *replicas):
+        app = create_app('sqlite:///' + self.primary, replica_paths=[
+            'sqlite:///' + path for path in replicas])
+        self.addCleanup(app.extensions['db_replicas'].dispose)
+        return app
+
+    def test_reads_go_to_replica(self):
+        client = self.create_app(self.replica).test_client()
+
+        res = client.get('/questions')
+        self.assertEqual(json.loads(res.data)['total_questions'], 12)
+        res = client.get('/categories/1/questions')
+        self.assertEqual(json.loads(res.data)['questions_num'], 7)
+
+    def test_indexes_read_from_primary(self):
+        # the replica lags: it lacks the write below
+        client = self.create_app(self.replica).test_client()
+        client.post('/questions', json={
+            'question': 'Written?', 'answer': 'Yes', 'difficulty': 1,
+            'category': 2})
+
+        res = client.post('/questions/search',
+                          json={'searchTerm': 'written'})
+        self.assertEqual(json.loads(res.data)['questions_num'], 1)
+        res = client.post('/questions/search',
+                          json={'searchTerm': 'replica'})
+        self.assertEqual(res.status_code, 404)
+
+    def test_writes_go_to_primary(self):
+        client = self.create_app(self.replica).test_client()
+
+        res = client.post('/questions', json={
+            'question': 'Written?', 'answer': 'Yes', 'difficulty': 1,
+            'category': 2})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        # read after write in the same request comes from the primary
+        self.assertEqual(data['total_questions'], 11)
+        for path, expected in ((self.primary, 1), (self.replica, 0)):
+            engine = create_engine('sqlite:///' + path)
+            with engine.connect() as connection:
+                rows = connection.execute(
+                    Question.__table__.select()
+                    .where(Question.question == 'Written?')).all()
+            engine.dispose()
+            self.assertEqual(len(rows), expected)
+
+    def test_bulk_delete_on_primary(self):
+        client = self.create_app(self.replica).test_client()
+
+        res = client.delete('/questions', json={'category': 1})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['deleted'], 5)
+        engine = create_engine('sqlite:///' + self.primary)
+        with engine.connect() as connection:
+            stats = connection.execute(QuestionStat.__table__.select()).all()
+        engine.dispose()
+        self.assertEqual({(row.category, row.count) for row in stats},
+                         {(1, 0), (2, 5)})
+
+    def test_failover_to_primary(self):
+        missing = os.path.join(self.directory, 'missing', 'replica.db')
+        client = self.create_app(missing).test_client()
+
+        res = client.get('/questions')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['total_questions'], 10)
+
+    def test_round_robin_skips_unhealthy(self):
+        other = os.path.join(self.directory, 'other.db')
+        shutil.copy(self.replica, other)
+        missing = os.path.join(self.directory, 'missing', 'replica.db')
+        router = ReplicaRouter.from_paths(
+            ['sqlite:///' + path for path in (self.replica, missing, other)])
+        self.addCleanup(router.dispose)
+
+        picked = [router.engine() for _ in range(4)]
+
+        self.assertEqual(picked, [router.engines[0], router.engines[2]] * 2)
+        router.mark_down(router.engines[0])
+        self.assertEqual(router.engine(), router.engines[2])
+        self.assertEqual(router.engine(), router.engines[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
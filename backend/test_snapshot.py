@@ -0,0 +1,143 @@
+import json
+import os
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine
+
+from flaskr import create_app
+from flaskr.coherency import SharedMemoryVersionStore
+from models import db, rebuild_question_stats, Question, Category
+
+
+class ReadOnlySnapshotTestCase(unittest.TestCase):
+    """This class represents the read-only snapshot test case"""
+
+    def setUp(self):
+        """Create a small question bank and a read-only app."""
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine('sqlite:///' + self.path)
+        db.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            connection.execute(Category.__table__.insert(), [
+                {'id': 1, 'type': 'Science'}, {'id': 2, 'type': 'Art'}])
+            connection.execute(Question.__table__.insert(), [{
+                'id': i + 1,
+                'question': 'Question number %d?' % i,
+                'answer': 'Answer %d' % (i % 3),
+                'category': 1 + i % 2,
+                'difficulty': 1 + i % 5,
+            } for i in range(25)])
+            rebuild_question_stats(connection)
+        self.app = create_app('sqlite:///' + self.path, read_only=True)
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.get_engine().dispose()
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def add_question_behind_the_snapshot(self):
+        with self.engine.begin() as connection:
+            connection.execute(Question.__table__.insert(), {
+                'id': 100, 'question': 'Added later?', 'answer': 'Yes',
+                'category': 2, 'difficulty': 1})
+
+    def test_get_questions(self):
+        self.add_question_behind_the_snapshot()
+        res = self.client().get('/questions?page=3')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [21, 22, 23, 24, 25])
+        self.assertEqual(data['total_questions'], 25)
+        self.assertEqual(data['categories'], [{'id': 1, 'type': 'Science'},
+                                              {'id': 2, 'type': 'Art'}])
+
+    def test_get_categories_questions_cursor(self):
+        res = self.client().get('/categories/2/questions')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['questions_num'], 12)
+        self.assertEqual(data['questions'][0], {
+            'id': 2, 'question': 'Question number 1?', 'answer': 'Answer 1',
+            'category': 2, 'difficulty': 2})
+
+        res = self.client().get('/categories/2/questions?cursor='
+                                + data['next_cursor'])
+        data = json.loads(res.data)
+
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [22, 24])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_quizzes(self):
+        res = self.client().post('/quizzes', json={
+            'previous_questions': list(range(1, 24)),
+            'quiz_category': {'type': 'Science', 'id': 1}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 25)
+
+    def test_reload_snapshot(self):
+        self.add_question_behind_the_snapshot()
+        res = self.client().post('/snapshot/reload')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['total_questions'], 26)
+        res = self.client().post('/questions/search',
+                                 json={'searchTerm': 'added later'})
+        self.assertEqual(json.loads(res.data)['questions_num'], 1)
+
+    def test_reload_large_difficulty(self):
+        with self.engine.begin() as connection:
+            connection.execute(Question.__table__.insert(), {
+                'id': 100, 'question': 'Very hard?', 'answer': 'Yes',
+                'category': 2, 'difficulty': 40000})
+        res = self.client().post('/snapshot/reload')
+
+        self.assertEqual(res.status_code, 200)
+        res = self.client().get('/questions?page=3')
+        questions = json.loads(res.data)['questions']
+        self.assertEqual(questions[-1]['difficulty'], 40000)
+
+    def test_reload_reaches_other_workers(self):
+        fd, versions_path = tempfile.mkstemp(suffix='.versions')
+        os.close(fd)
+        self.addCleanup(os.remove, versions_path)
+        workers = []
+        for _ in range(2):
+            store = SharedMemoryVersionStore(versions_path)
+            self.addCleanup(store.close)
+            workers.append(create_app('sqlite:///' + self.path,
+                                      read_only=True, version_store=store))
+        self.add_question_behind_the_snapshot()
+
+        workers[0].test_client().post('/snapshot/reload')
+        res = workers[1].test_client().get('/questions')
+
+        self.assertEqual(json.loads(res.data)['total_questions'], 26)
+
+    def test_writes_rejected(self):
+        res = self.client().delete('/questions/1')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 405)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Method not allowed')
+
+    def test_reload_without_snapshot_error(self):
+        app = create_app('sqlite:///' + self.path)
+        res = app.test_client().post('/snapshot/reload')
+
+        self.assertEqual(res.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,6 +10,7 @@ class QuizView extends Component {
         super();
         this.state = {
             quizCategory: null,
+            roundQuestions: [],
             previousQuestions: [],
             showAnswer: false,
             categories: {},
@@ -36,24 +37,17 @@ class QuizView extends Component {
     }
 
     selectCategory = ({type, id=0}) => {
-        this.setState({quizCategory: {type, id}}, this.getNextQuestion)
+        this.setState({quizCategory: {type, id}}, this.startRound)
     }
 
-    handleChange = (event) => {
-        this.setState({[event.target.name]: event.target.value})
-    }
-
-    getNextQuestion = () => {
-        const previousQuestions = [...this.state.previousQuestions]
-        if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
-
+    startRound = () => {
         $.ajax({
-            url: '/quizzes',
+            url: '/quizzes/batch',
             type: "POST",
             dataType: 'json',
             contentType: 'application/json',
             data: JSON.stringify({
-                previous_questions: previousQuestions,
+                questions_num: questionsPerPlay,
                 quiz_category: this.state.quizCategory
             }),
             xhrFields: {
@@ -61,22 +55,35 @@ class QuizView extends Component {
             },
             crossDomain: true,
             success: (result) => {
-                this.setState({
-                    showAnswer: false,
-                    previousQuestions: previousQuestions,
-                    currentQuestion: result.question,
-                    guess: '',
-                    forceEnd: result.question ? false : true
-                })
+                this.setState({ roundQuestions: result.questions }, this.getNextQuestion)
                 return;
             },
             error: (error) => {
-                alert('Unable to load question. Please try your request again')
+                alert('Unable to start the quiz. Please try your request again')
                 return;
             }
         })
     }
 
+    handleChange = (event) => {
+        this.setState({[event.target.name]: event.target.value})
+    }
+
+    getNextQuestion = () => {
+        const previousQuestions = [...this.state.previousQuestions]
+        if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
+
+        const [nextQuestion, ...roundQuestions] = this.state.roundQuestions
+        this.setState({
+            showAnswer: false,
+            previousQuestions: previousQuestions,
+            roundQuestions: roundQuestions,
+            currentQuestion: nextQuestion || null,
+            guess: '',
+            forceEnd: nextQuestion ? false : true
+        })
+    }
+
     submitGuess = (event) => {
         event.preventDefault();
         // eslint-disable-next-line
@@ -91,6 +98,7 @@ class QuizView extends Component {
     restartGame = () => {
         this.setState({
             quizCategory: null,
+            roundQuestions: [],
             previousQuestions: [],
             showAnswer: false,
             numCorrect: 0,
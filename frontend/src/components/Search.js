@@ -1,8 +1,10 @@
 import React, { Component } from 'react'
+import $ from 'jquery';
 
 class Search extends Component {
   state = {
     query: '',
+    suggestions: [],
   }
 
   getInfo = (event) => {
@@ -11,8 +13,30 @@ class Search extends Component {
   }
 
   handleInputChange = () => {
-    this.setState({
-      query: this.search.value
+    const query = this.search.value
+    this.setState({ query })
+    this.getSuggestions(query)
+  }
+
+  getSuggestions = (prefix) => {
+    if (!prefix.trim()) {
+      this.setState({ suggestions: [] })
+      return;
+    }
+    $.ajax({
+      url: `/questions/suggest?prefix=${encodeURIComponent(prefix)}`,
+      type: "GET",
+      success: (result) => {
+        // answers to older keystrokes may arrive late
+        if (prefix === this.state.query) {
+          this.setState({ suggestions: result.suggestions })
+        }
+        return;
+      },
+      error: (error) => {
+        this.setState({ suggestions: [] })
+        return;
+      }
     })
   }
 
@@ -23,7 +47,13 @@ class Search extends Component {
           placeholder="Search questions..."
           ref={input => this.search = input}
           onChange={this.handleInputChange}
+          list="question-suggestions"
         />
+        <datalist id="question-suggestions">
+          {this.state.suggestions.map(suggestion => (
+            <option key={suggestion.id} value={suggestion.question}/>
+          ))}
+        </datalist>
         <input type="submit" value="Submit" className="button"/>
       </form>
     )